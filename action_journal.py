@@ -0,0 +1,91 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Append-only journal of the approvals, rejections and bonuses sent to Mechanical Turk.
+
+Every successful action is written as one JSON line keyed by AssignmentId, so a re-run of a tool after a
+partial failure can skip the work that was already done instead of spending a round trip on an error.
+Works with both the boto (Python 2) and boto3 (Python 3) scripts.
+"""
+
+from __future__ import print_function
+
+import errno
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+try:
+    from datetime import timezone
+
+    def utcnow():
+        return datetime.now(timezone.utc)
+except ImportError:
+    # Python 2 has no timezone.utc, and nothing there deprecates utcnow
+    utcnow = datetime.utcnow
+
+DEFAULT_JOURNAL = os.path.join(os.path.expanduser('~'), '.mturkutils', 'journal.jsonl')
+
+APPROVE = 'approve'
+REJECT = 'reject'
+BONUS = 'bonus'
+
+
+def journal_entries(filename=DEFAULT_JOURNAL):
+    """Yield every complete entry in the journal as a dict."""
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'r') as journal:
+        for line in journal:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue  # a run killed mid-write can leave a partial last line
+
+
+def read_journal(filename=DEFAULT_JOURNAL):
+    """Return a dict mapping each AssignmentId in the journal to the set of actions done for it."""
+    done = defaultdict(set)
+    for entry in journal_entries(filename):
+        done[entry['assignmentid']].add(entry['action'])
+    return done
+
+
+def open_journal(filename=DEFAULT_JOURNAL):
+    """Open the journal for appending, creating its directory if needed."""
+    journaldir = os.path.dirname(filename)
+    if journaldir:
+        try:
+            os.makedirs(journaldir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    return open(filename, 'a')
+
+
+def record(journal, action, assignmentid, **details):
+    """Append an action to an open journal and flush it to disk right away."""
+    entry = dict(details, action=action, assignmentid=assignmentid, time=utcnow().isoformat())
+    journal.write(json.dumps(entry, sort_keys=True) + '\n')
+    journal.flush()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Compare the expat QuestionFormAnswers parser against the old xmltodict based one."""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'boto3'))
+
+from answers import parse_answers  # noqa: E402
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+
+def make_answer_xml(questions: int, answer_size: int) -> str:
+    """
+    Build a QuestionFormAnswers document with `questions` FreeText answers of `answer_size` characters.
+
+    Every other answer is padded with whitespace and newlines, as HTML forms often submit them.
+    """
+    answer = ('x' * (answer_size - 1)) + '&amp;'
+    padding = ('', '\n    ')
+    body = ''.join(f'<Answer><QuestionIdentifier>q{i}</QuestionIdentifier>'
+                   f'<FreeText>{padding[i % 2]}{answer}{padding[i % 2]}</FreeText></Answer>'
+                   for i in range(questions))
+    return ('<?xml version="1.0" encoding="ASCII"?><QuestionFormAnswers xmlns="http://mechanicalturk.amazonaws.com/'
+            f'AWSMechanicalTurkDataSchemas/2005-10-01/QuestionFormAnswers.xsd">{body}</QuestionFormAnswers>')
+
+
+def xmltodict_answers(xml: str) -> dict:
+    """The way getResults used to pull answers out of an assignment."""
+    import xmltodict
+    ordered_answers = xmltodict.parse(xml).get('QuestionFormAnswers').get('Answer')
+    if issubclass(ordered_answers.__class__, dict):
+        return {f"Answer.{ordered_answers['QuestionIdentifier']}": ordered_answers['FreeText']}
+    return {f"Answer.{d['QuestionIdentifier']}": d['FreeText'] for d in ordered_answers}
+
+
+def expat_answers(xml: str) -> dict:
+    """The way getResults pulls answers out of an assignment now."""
+    return {f'Answer.{qid}': answer for qid, answer in parse_answers(xml)}
+
+
+parser = argparse.ArgumentParser(description='Benchmark parsing of assignment Answer XML')
+parser.add_argument('-q', '--questions', type=int, default=200, help='Answers per assignment (default: 200)')
+parser.add_argument('-a', '--answersize', type=int, default=500, help='Characters per answer (default: 500)')
+parser.add_argument('-n', '--number', type=int, default=200, help='Assignments to parse per timing (default: 200)')
+args = parser.parse_args()
+
+xml = make_answer_xml(args.questions, args.answersize)
+print(f'{args.questions} answers of {args.answersize} characters ({len(xml) / 1024:.1f} KiB per assignment)')
+
+timings = {'expat': expat_answers}
+try:
+    import xmltodict  # noqa: F401
+    timings['xmltodict'] = xmltodict_answers
+    assert expat_answers(xml) == xmltodict_answers(xml)
+except ImportError:
+    print('xmltodict is not installed; only timing the expat parser')
+
+for name, func in timings.items():
+    best = min(timeit.repeat(lambda: func(xml), number=args.number, repeat=5))
+    print(f'{name:>10}: {args.number / best:,.0f} assignments/s ({len(xml) * args.number / best / 2 ** 20:,.1f} MiB/s)')
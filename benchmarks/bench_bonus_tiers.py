@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Time the bonus tiering in calculateBonus.py on synthetic results of 10^5 to 10^6 rows."""
+
+import argparse
+import os
+import random
+import sys
+import time
+from itertools import tee
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from bonus_tiers import count_results, tier_workers  # noqa: E402
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+BONUS_STEPS = [{'count': 10, 'amount': 0.5}, {'count': 50, 'amount': 2.0}, {'count': 100, 'amount': 5.0}]
+
+
+def pairwise(iterable):
+    """s -> (s0,s1), (s1,s2), (s2, s3), ..."""
+    a, b = tee(iterable)
+    next(b, None)
+    return zip(a, b)
+
+
+def scanning_tiers(results_list, bonus_steps):
+    """The way calculateBonus used to do it, scanning every row once per worker."""
+    workers = set([row[0] for row in results_list])
+    workers_by_count = []
+    for w in workers:
+        matching_rows = [x for x in results_list if x[0] == w]
+        workers_by_count.append(dict((('workerid', w), ('count', len(matching_rows)), ('assignmentid', matching_rows[0][1]))))
+    workers_by_count = sorted(workers_by_count, key=lambda k: k['count'])
+    step_indices = [s['count'] for s in bonus_steps]
+    step_indices.append(float("inf"))
+    bonus_workers = [w for w in workers_by_count if w['count'] >= step_indices[0]]
+    return [[w for w in bonus_workers if x <= w['count'] < y] for x, y in pairwise(step_indices)]
+
+
+def grouped_tiers(results, bonus_steps):
+    """The way calculateBonus does it now, from the columns results_loader reads."""
+    counts, first_assignment = count_results(results)
+    return tier_workers(counts, first_assignment, bonus_steps)
+
+
+def synthetic_results(rows: int, workers: int):
+    """Results rows as (workerid, assignmentid) spread at random over `workers` workers."""
+    rng = random.Random(0)
+    return [(f'W{rng.randrange(workers):06d}', f'A{i:08d}') for i in range(rows)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+parser = argparse.ArgumentParser(description='Benchmark bonus tiering')
+parser.add_argument('-r', '--rows', type=int, nargs='+', default=[10 ** 4, 10 ** 5, 10 ** 6],
+                    help='Sizes of synthetic results to tier (default: 10000 100000 1000000)')
+parser.add_argument('-w', '--workers', type=int, default=5000, help='Distinct workers (default: 5000)')
+parser.add_argument('-l', '--legacyrows', type=int, default=20000,
+                    help='Largest size to also time the old per-worker scan on, which is quadratic (default: 20000)')
+args = parser.parse_args()
+
+for rows in args.rows:
+    results_list = synthetic_results(rows, args.workers)
+    results = pd.DataFrame(results_list, columns=['workerid', 'assignmentid']).astype({'workerid': 'category'})
+    blocks, grouped = timed(grouped_tiers, results, BONUS_STEPS)
+    line = f'{rows:>9,} rows: grouped {grouped:.3f} s'
+    if rows <= args.legacyrows:
+        old_blocks, scanning = timed(scanning_tiers, results_list, BONUS_STEPS)
+        # same workers, counts and assignments in every tier; the old scan broke ties in set order
+        def by_worker(tiers):
+            return [sorted(b, key=lambda w: w['workerid']) for b in tiers]
+        assert by_worker(blocks) == by_worker(old_blocks)
+        line += f', scanning {scanning:.3f} s ({scanning / grouped:,.0f}x slower)'
+    print(line)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Time the submit time density and percentiles in time_pay_stats.py on synthetic long-tailed durations."""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from duration_stats import DurationHistogram, binned_kde  # noqa: E402
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+
+def exact_kde(durations: np.ndarray):
+    """The way submit_time_histogram used to do it, evaluating gaussian_kde every 0.1 seconds."""
+    from scipy.stats import gaussian_kde
+    density = gaussian_kde(durations)
+    density.covariance_factor = lambda: .25
+    density._compute_covariance()
+    xs = np.arange(0., np.max(durations), 0.1)
+    return xs, density(xs)
+
+
+def streamed_percentiles(durations: np.ndarray, chunk: int):
+    histogram = DurationHistogram()
+    for start in range(0, len(durations), chunk):
+        histogram.add(durations[start:start + chunk])
+    return [histogram.quantile(q) for q in (0.1, 0.5, 0.9)]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+parser = argparse.ArgumentParser(description='Benchmark submit time density estimates and percentiles')
+parser.add_argument('-d', '--durations', type=int, nargs='+', default=[10 ** 4, 10 ** 6],
+                    help='Numbers of synthetic durations (default: 10000 1000000)')
+parser.add_argument('-l', '--legacydurations', type=int, default=10000,
+                    help='Largest number of durations to also time gaussian_kde on (default: 10000)')
+args = parser.parse_args()
+
+rng = np.random.RandomState(0)
+for n in args.durations:
+    # log-normal around a couple of minutes, with a few workers who left the HIT open for hours
+    durations = rng.lognormal(5, 1, n)
+    _, binned = timed(binned_kde, durations)
+    percentiles, streamed = timed(streamed_percentiles, durations, 10 ** 5)
+    error = np.max(np.abs(np.array(percentiles) / np.percentile(durations, [10, 50, 90]) - 1))
+    line = f'{n:>9,} durations: binned KDE {binned:.3f} s, streamed percentiles {streamed:.3f} s ' \
+           f'(max error {error:.2%})'
+    if n <= args.legacydurations:
+        try:
+            _, exact = timed(exact_kde, durations)
+            line += f', gaussian_kde {exact:.3f} s ({exact / binned:,.0f}x slower)'
+        except ImportError:
+            pass
+    print(line)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Time building results rows per assignment, with and without a precomputed per-HIT row template."""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'boto3'))
+
+from answers import parse_answers  # noqa: E402
+from result_rows import OPTIONAL_ASSIGNMENT_KEYS, hit_row, manage_url, process_assignment  # noqa: E402
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+
+def rebuilt_row(assignment: dict, hitinfo: dict, sandbox: bool=False):
+    """The way getResults used to build every row, recomputing the HIT columns each time."""
+    row = {
+        'assignmentid': assignment['AssignmentId'],
+        'assignmentstatus': assignment['AssignmentStatus'],
+        'autoapprovaltime': assignment['AutoApprovalTime'],
+        'hitid': assignment['HITId'],
+        'viewhit': manage_url(assignment['HITId'], sandbox),
+        'assignmentsubmittime': assignment['SubmitTime'],
+        'workerid': assignment['WorkerId'],
+        'assignmentaccepttime': '',
+        'assignmentapprovaltime': '',
+        'assignmentrejecttime': '',
+        'deadline': '',
+        'feedback': '',
+        'reject': '',
+        'hittypeid': hitinfo['HITTypeId'],
+        'hitgroupid': hitinfo['HITGroupId'],
+        'title': hitinfo['Title'],
+        'description': hitinfo['Description'],
+        'keywords': hitinfo['Keywords'],
+        'reward': '$' + hitinfo['Reward'],
+        'creationtime': hitinfo['CreationTime'],
+        'assignments': hitinfo['MaxAssignments'],
+        'numavailable': hitinfo['NumberOfAssignmentsAvailable'],
+        'numpending': hitinfo['NumberOfAssignmentsPending'],
+        'numcomplete': hitinfo['NumberOfAssignmentsCompleted'],
+        'hitstatus': hitinfo['HITStatus'],
+        'reviewstatus': hitinfo['HITReviewStatus'],
+        'assignmentduration': hitinfo['AssignmentDurationInSeconds'],
+        'autoapprovaldelay': hitinfo['AutoApprovalDelayInSeconds'],
+        'hitlifetime': hitinfo['Expiration'],
+        'annotation': ''
+    }
+    for k, v in OPTIONAL_ASSIGNMENT_KEYS.items():
+        if k in assignment:
+            row[v] = assignment[k]
+    assignment_keys = set()
+    if 'QualificationRequirements' in hitinfo:
+        for i, qual in enumerate(['|'.join(['{}:{}'.format(k, v) for k, v in x.items()]) for x in hitinfo['QualificationRequirements']]):
+            qualkey = 'Qualification.{}'.format(i)
+            row[qualkey] = qual
+            assignment_keys.add(qualkey)
+    if 'RequesterAnnotation' in hitinfo:
+        row['annotation'] = hitinfo['RequesterAnnotation']
+    user_answers = {f'Answer.{qid}': answer for qid, answer in parse_answers(assignment.get('Answer'))}
+    assignment_keys.update(user_answers)
+    row.update(user_answers)
+    return row, assignment_keys
+
+
+now = datetime.now()
+hitinfo = {
+    'HITId': '3AQN9REUTFHBTHRCBBKQGJRQ3HYYD6', 'HITTypeId': '3MJBPJ4JTBHIF4SDCFXV6ICHDCPGDJ',
+    'HITGroupId': '3YFJPYG1TVHBSVRQM4RJN9HVSS2DYL', 'Title': 'Listen to words and answer questions',
+    'Description': 'A dummy experiment', 'Keywords': 'dummy, test', 'Reward': '0.50', 'CreationTime': now,
+    'MaxAssignments': 500, 'NumberOfAssignmentsAvailable': 0, 'NumberOfAssignmentsPending': 0,
+    'NumberOfAssignmentsCompleted': 500, 'HITStatus': 'Reviewable', 'HITReviewStatus': 'NotReviewed',
+    'AssignmentDurationInSeconds': 2100, 'AutoApprovalDelayInSeconds': 1296000, 'Expiration': now,
+    'RequesterAnnotation': 'batch 1',
+    'QualificationRequirements': [
+        {'QualificationTypeId': '000000000000000000L0', 'Comparator': 'GreaterThan', 'IntegerValues': [95],
+         'RequiredToPreview': True},
+        {'QualificationTypeId': '00000000000000000071', 'Comparator': 'EqualTo',
+         'LocaleValues': [{'Country': 'US'}], 'RequiredToPreview': True},
+        {'QualificationTypeId': '3HYHKN2SUTDSRBRJD8ZXOVJSPX8EF0', 'Comparator': 'DoesNotExist',
+         'RequiredToPreview': True},
+    ]
+}
+
+parser = argparse.ArgumentParser(description='Benchmark building results rows from assignments')
+parser.add_argument('-a', '--assignments', type=int, default=500, help='Assignments for the HIT (default: 500)')
+args = parser.parse_args()
+
+answer = ('<QuestionFormAnswers><Answer><QuestionIdentifier>comments</QuestionIdentifier>'
+          '<FreeText>none</FreeText></Answer></QuestionFormAnswers>')
+assignments = [{'AssignmentId': f'A{i}', 'WorkerId': f'W{i}', 'HITId': hitinfo['HITId'],
+                'AssignmentStatus': 'Submitted', 'AutoApprovalTime': now, 'AcceptTime': now, 'SubmitTime': now,
+                'Answer': answer} for i in range(args.assignments)]
+
+
+def per_assignment():
+    return [rebuilt_row(a, hitinfo) for a in assignments]
+
+
+def per_hit():
+    template = hit_row(hitinfo)
+    return [process_assignment(a, template) for a in assignments]
+
+
+assert per_assignment() == per_hit()
+
+for name, func in (('rebuilt', per_assignment), ('template', per_hit)):
+    best = min(timeit.repeat(func, number=20, repeat=5)) / 20
+    print(f'{name:>10}: {best / args.assignments * 1e6:.2f} us per assignment')
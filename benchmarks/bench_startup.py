@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Time how long each command line script takes to start, i.e. to import everything and print --help."""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+ENTRY_POINTS = ['time_pay_stats.py', 'calculateBonus.py', 'batchify.py'] + \
+    sorted(os.path.join('boto3', f) for f in os.listdir(os.path.join(ROOT, 'boto3')) if f.endswith('.boto3.py'))
+
+
+def startup_time(command: list, repeat: int) -> float:
+    """Best wall clock time of `repeat` runs of a Python command, or None if it can't run here."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable] + command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                              cwd=ROOT)
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            print(f'{command[0]}: {proc.stderr.decode().strip().splitlines()[-1]}')
+            return None
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+parser = argparse.ArgumentParser(description='Benchmark startup time of the command line scripts')
+parser.add_argument('-n', '--repeat', type=int, default=5, help='Runs of each script to take the best of (default: 5)')
+parser.add_argument('scripts', nargs='*', default=ENTRY_POINTS, help='Scripts to time (default: all of them)')
+args = parser.parse_args()
+
+print(f'{"python -c pass":>35}: {startup_time(["-c", "pass"], args.repeat) * 1000:7.1f} ms')
+for script in args.scripts:
+    elapsed = startup_time([script, '--help'], args.repeat)
+    if elapsed is not None:
+        print(f'{script:>35}: {elapsed * 1000:7.1f} ms')
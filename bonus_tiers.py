@@ -0,0 +1,142 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Work out which bonus tier each worker falls in from how many trials they did.
+
+Used by calculateBonus.py. Everything is done in a single pass over the results rows plus a binary search
+per worker, rather than scanning every row once per worker. Trials can be totalled across many results
+files; the counts for each file are cached by a hash of its contents so unchanged files aren't re-read,
+and the rest are read in parallel with results_loader.
+"""
+
+from __future__ import division
+
+import errno
+import json
+import os
+from bisect import bisect_right
+from collections import Counter
+from operator import itemgetter
+
+from results_loader import current_digest, iter_results, replace
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.mturkutils', 'bonus_counts')
+
+
+def count_results(results):
+    """
+    Count the trials (results rows) each worker did in a DataFrame of results rows.
+
+    Returns a Counter of trials per workerid and a dict of the first assignmentid seen for each worker,
+    both in the order workers first appear.
+    """
+    counts = results.groupby('workerid', sort=False, observed=True).size()
+    first = results.drop_duplicates('workerid')
+    return (Counter(dict(zip(counts.index.astype(str), counts.tolist()))),
+            dict(zip(first['workerid'].astype(str), first['assignmentid'])))
+
+
+def cache_filename(filename, cachedir):
+    """Where the counts for a results file are cached, going by the hash of its contents."""
+    return os.path.join(cachedir, current_digest(filename) + '.json') if cachedir else None
+
+
+def load_counts(cachefile):
+    """
+    Counts cached by save_counts, or None if there aren't any.
+
+    A truncated or corrupt cache file is removed, and None returned so the results file is counted again.
+    """
+    if not cachefile or not os.path.exists(cachefile):
+        return None
+    try:
+        with open(cachefile, 'r') as infile:
+            cached = json.load(infile)
+        return Counter(cached['counts']), cached['first_assignment']
+    except (ValueError, KeyError, TypeError, OSError):
+        try:
+            os.remove(cachefile)
+        except OSError:
+            pass
+        return None
+
+
+def save_counts(cachefile, filename, counts, first_assignment):
+    """
+    Cache the counts for a results file where load_counts will find them.
+
+    The counts go to a temporary file that then replaces the cache file, so a killed run or a run in
+    parallel never leaves a half written one behind.
+    """
+    try:
+        os.makedirs(os.path.dirname(cachefile))
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    tmpfile = '{}.{}.tmp'.format(cachefile, os.getpid())
+    with open(tmpfile, 'w') as outfile:
+        json.dump({'file': filename, 'counts': counts, 'first_assignment': first_assignment}, outfile)
+    replace(tmpfile, cachefile)
+
+
+def count_files(filenames, cachedir=DEFAULT_CACHE_DIR, processes=None):
+    """
+    Total the trials each worker did across many results files.
+
+    Files without cached counts are read in parallel by up to `processes` processes (see
+    results_loader.iter_results). Each worker's assignmentid comes from the first file they appear in.
+    """
+    cachefiles = dict((f, cache_filename(f, cachedir)) for f in filenames)
+    file_counts = dict((f, load_counts(cachefiles[f])) for f in filenames)
+    uncached = sorted(set(f for f in filenames if file_counts[f] is None), key=filenames.index)
+    for filename, results in iter_results(uncached, ['workerid', 'assignmentid'], categorical=['workerid'],
+                                          processes=processes):
+        file_counts[filename] = count_results(results)
+        if cachedir:
+            save_counts(cachefiles[filename], filename, *file_counts[filename])
+
+    counts = Counter()
+    first_assignment = {}
+    for filename in filenames:
+        counts.update(file_counts[filename][0])
+        for workerid, assignmentid in file_counts[filename][1].items():
+            first_assignment.setdefault(workerid, assignmentid)
+    return counts, first_assignment
+
+
+def tier_workers(counts, first_assignment, bonus_steps):
+    """
+    Sort workers into bonus blocks, one per step in bonus_steps (which must be sorted by 'count').
+
+    A worker belongs to the highest step whose count they reached. Workers in each block are ordered by
+    trial count; workers below the first step are left out.
+    """
+    step_counts = [s['count'] for s in bonus_steps]
+    bonus_blocks = [[] for _ in bonus_steps]
+    # sorted() is stable, so ties stay in the order workers first appeared
+    for workerid, count in sorted(counts.items(), key=itemgetter(1)):
+        step = bisect_right(step_counts, count) - 1
+        if step >= 0:
+            bonus_blocks[step].append({'workerid': workerid, 'count': count,
+                                       'assignmentid': first_assignment[workerid]})
+    return bonus_blocks
@@ -22,10 +22,16 @@
 
 from __future__ import print_function
 import argparse
+import os
+import sys
 import pandas as pd
-from boto.mturk.connection import MTurkConnection
+from boto.mturk.connection import MTurkConnection, MTurkRequestError
 from boto import config
 
+# the action journal is shared with the boto3 scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from action_journal import APPROVE, DEFAULT_JOURNAL, REJECT, open_journal, read_journal, record
+
 __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 
 parser = argparse.ArgumentParser(description='Approve work from Amazon Mechanical Turk')
@@ -34,6 +40,9 @@ parser.add_argument('-s', '--sandbox', action='store_true',
                     help='Run the command in the Mechanical Turk Sandbox (used for testing purposes)')
 parser.add_argument('-p', '--profile',
         help='Run commands using specific aws credentials rather the default. To set-up alternative credentials see http://boto3.readthedocs.org/en/latest/guide/configuration.html#shared-credentials-file')
+parser.add_argument('-j', '--journal', default=DEFAULT_JOURNAL,
+                    help='Journal of every approval and rejection already sent, so re-runs skip them '
+                         '(default: ~/.mturkutils/journal.jsonl)')
 args = parser.parse_args()
 
 if args.sandbox:
@@ -50,6 +59,15 @@ mtc = MTurkConnection(is_secure=True, profile_name=args.profile)
 
 # TODO: to copy behavior of Java tools, reject any that have an 'x' in the
 # 'reject' column and send feedback based on value of 'feedback' column
-for a in list(needapproval['assignmentid']):
-    print("Approving {}".format(a))
-    mtc.approve_assignment(a)
+done = read_journal(args.journal)
+with open_journal(args.journal) as journal:
+    for a in list(needapproval['assignmentid']):
+        if done[a] & set([APPROVE, REJECT]):
+            print("Skipping {}, already reviewed".format(a))
+            continue
+        print("Approving {}".format(a))
+        try:
+            mtc.approve_assignment(a)
+            record(journal, APPROVE, a)
+        except MTurkRequestError as e:
+            print(e)
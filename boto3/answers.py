@@ -0,0 +1,81 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Parse the QuestionFormAnswers XML MTurk returns as an assignment's Answer.
+
+An Answer holds a QuestionIdentifier and one of:
+  a) FreeText
+  b) a sequence of SelectionIdentifier and/or OtherSelectionText
+  c) UploadedFileSizeInBytes and UploadedFileKey
+
+http://docs.aws.amazon.com/AWSMechTurk/latest/AWSMturkAPI/ApiReference_QuestionFormAnswersDataStructureArticle.html
+http://mechanicalturk.amazonaws.com/AWSMechanicalTurkDataSchemas/2005-10-01/QuestionFormAnswers.xsd
+"""
+
+from typing import List, Tuple
+from xml.parsers import expat
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+# elements whose text is (part of) the answer itself
+VALUE_ELEMENTS = {'FreeText', 'SelectionIdentifier', 'OtherSelectionText', 'UploadedFileKey'}
+
+
+def parse_answers(xml: str) -> List[Tuple[str, str]]:
+    """
+    Turn a QuestionFormAnswers XML string into (QuestionIdentifier, answer) pairs.
+
+    Leading and trailing whitespace is stripped from every value. Multiple selections are joined with
+    '|', the same as the original MTurk command line tools. The size of
+    an uploaded file is given its own pair, keyed '<QuestionIdentifier>.UploadedFileSizeInBytes'.
+    """
+    answers = []
+    text = []
+    values = []
+    current = {'id': None, 'size': None}
+
+    def start_element(name, attrs):
+        text.clear()
+
+    def end_element(name):
+        name = name.rpartition(':')[2]  # drop any namespace prefix
+        if name in VALUE_ELEMENTS:
+            # xmltodict, which getResults used to use, strips whitespace around every value
+            values.append(''.join(text).strip())
+        elif name == 'QuestionIdentifier':
+            current['id'] = ''.join(text).strip()
+        elif name == 'UploadedFileSizeInBytes':
+            current['size'] = ''.join(text).strip()
+        elif name == 'Answer':
+            answers.append((current['id'], '|'.join(values)))
+            if current['size'] is not None:
+                answers.append((f"{current['id']}.UploadedFileSizeInBytes", current['size']))
+            values.clear()
+            current['id'] = current['size'] = None
+        text.clear()
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = text.append
+    parser.Parse(xml, True)
+    return answers
@@ -21,6 +21,10 @@
 # SOFTWARE.
 
 import argparse
+import os
+import sys
+import time
+from typing import Callable, Optional, Tuple
 
 import boto3
 
@@ -28,14 +32,50 @@ from botocore.exceptions import ClientError
 
 import pandas as pd
 
+from concurrency import call_with_backoff, client_config, iter_completed, rate_limited, with_progress
+
+# the action journal is shared with the original boto scripts, and the results loader with the analysis scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from action_journal import APPROVE, DEFAULT_JOURNAL, REJECT, open_journal, read_journal, record  # noqa: E402
+from results_loader import load_results  # noqa: E402
+
 __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 
-parser = argparse.ArgumentParser(description='Approve work from Amazon Mechanical Turk')
+
+def send(method: Callable, **kwargs):
+    """Make an API call. Replaced by a rate limited version when --rate is given."""
+    return method(**kwargs)
+
+
+def review(item: Tuple[str, str, str]) -> Tuple[str, str, Optional[ClientError]]:
+    """Approve or reject an assignment, returning the action, its id and the error if it failed."""
+    action, assignmentid, feedback = item
+    kwargs = {'AssignmentId': assignmentid}
+    if feedback:
+        kwargs['RequesterFeedback'] = feedback
+    try:
+        call_with_backoff(send, mtc.approve_assignment if action == APPROVE else mtc.reject_assignment, **kwargs)
+        return action, assignmentid, None
+    except ClientError as e:
+        return action, assignmentid, e
+
+
+parser = argparse.ArgumentParser(description='Approve work from Amazon Mechanical Turk, rejecting any rows with an '
+                                             '"x" in the reject column')
 parser.add_argument('-r', '--resultsfile', required=True, help='Filename for tab delimited CSV file')
 parser.add_argument('-s', '--sandbox', action='store_true',
                     help='Run the command in the Mechanical Turk Sandbox (used for testing purposes)')
 parser.add_argument('-p', '--profile',
         help='Run commands using specific aws credentials rather the default. To set-up alternative credentials see http://boto3.readthedocs.org/en/latest/guide/configuration.html#shared-credentials-file')
+parser.add_argument('-n', '--concurrency', type=int, default=1,
+                    help='Number of assignments to approve or reject in parallel (default: 1)')
+parser.add_argument('--rate', type=float, help='Maximum number of approvals and rejections to send per second')
+parser.add_argument('--rejectfeedback',
+                    help='Feedback to send with rejections whose feedback column is empty. MTurk requires a '
+                         'reason for every rejection.')
+parser.add_argument('-j', '--journal', default=DEFAULT_JOURNAL,
+                    help='Journal of every approval and rejection already sent, so re-runs skip them '
+                         '(default: ~/.mturkutils/journal.jsonl)')
 args = parser.parse_args()
 
 # Only region w/ MTurk endpoint currently is us-east-1
@@ -44,17 +84,47 @@ endpoint = f'https://mturk-requester-sandbox.{region}.amazonaws.com' if args.san
 # If you want to use profiles, you have to create a Session with one before connecting a client
 session = boto3.Session(profile_name=args.profile)
 
-results = pd.read_csv(args.resultsfile, sep='\t')
+results = load_results([args.resultsfile], ['assignmentid', 'assignmentstatus'], optional=['reject', 'feedback'])
 
-needapproval = results[results['assignmentstatus'] == 'Submitted']
+# Split everything that still needs reviewing into approvals and rejections in one pass, the way the
+# Java tools did: an 'x' in the 'reject' column rejects, with the 'feedback' column sent to the worker
+submitted = results['assignmentstatus'] == 'Submitted'
+rejected = results.get('reject', pd.Series('', index=results.index)).fillna('').str.strip().str.lower() == 'x'
+feedback = results.get('feedback', pd.Series('', index=results.index)).fillna('').str.strip()
+needreview = pd.DataFrame({
+    'action': rejected.map({True: REJECT, False: APPROVE}),
+    'assignmentid': results['assignmentid'],
+    'feedback': feedback.mask(rejected & (feedback == ''), args.rejectfeedback or '')
+})[submitted]
 
-mtc = session.client('mturk', endpoint_url=endpoint, region_name=region)
+done = read_journal(args.journal)
+to_review = [tuple(r) for r in needreview.itertuples(index=False) if not done[r.assignmentid] & {APPROVE, REJECT}]
+if len(to_review) < len(needreview):
+    print(f'Skipping {len(needreview) - len(to_review)} assignments already reviewed according to {args.journal}')
 
-# TODO: to copy behavior of Java tools, reject any that have an 'x' in the
-# 'reject' column and send feedback based on value of 'feedback' column
-for a in list(needapproval['assignmentid']):
-    try:
-        print("Approving {}".format(a))
-        mtc.approve_assignment(AssignmentId=a)
-    except ClientError as e:
-        print(e)
+# only rejections still to be sent need a reason, so a re-run after a partial failure doesn't need one again
+missing_reason = sum(1 for action, _, feedback in to_review if action == REJECT and not feedback)
+if missing_reason:
+    print(f'{missing_reason} rows are marked for rejection without any feedback. Fill in their feedback '
+          'column or pass --rejectfeedback; aborting')
+    sys.exit(1)
+
+mtc = session.client('mturk', endpoint_url=endpoint, region_name=region, config=client_config(args.concurrency))
+if args.rate:
+    send = rate_limited(send, args.rate)
+
+num_rejects = sum(1 for r in to_review if r[0] == REJECT)
+print(f'Approving {len(to_review) - num_rejects} and rejecting {num_rejects} assignments')
+start = time.monotonic()
+failed = 0
+with open_journal(args.journal) as journal:
+    # record each review the moment it succeeds, so a killed run never re-sends one that went through
+    for action, a, error in with_progress(iter_completed(review, to_review, args.concurrency), len(to_review),
+                                          'Reviewed', succeeded=lambda r: r[2] is None):
+        if error:
+            failed += 1
+            print(f'{a}: {error}')
+        else:
+            record(journal, action, a)
+
+print(f'Reviewed {len(to_review) - failed} and failed {failed} in {time.monotonic() - start:.1f} seconds')
@@ -25,11 +25,16 @@ __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 import argparse
 
 from csv import DictReader
+from typing import Tuple
 
 import boto3
 
 from botocore.exceptions import ClientError
 
+from concurrency import call_with_backoff, client_config, iter_concurrently, with_progress
+
+from qualifications import DEFAULT_CACHE_DIR, REFRESH_MODES, add_holder, get_holders, holds, save_cache
+
 parser = argparse.ArgumentParser(description='Assign a qualification to Amazon Mechanical Turk workers')
 parser.add_argument('-q', '--qualification', required=True, help='Qualification ID')
 parser.add_argument('-r', '--resultsfile', required=True, help='Filename of tab delimited CSV file with results')
@@ -37,6 +42,15 @@ parser.add_argument('-s', '--sandbox', action='store_true',
                     help='Run the command in the Mechanical Turk Sandbox (used for testing purposes)')
 parser.add_argument('-p', '--profile',
         help='Run commands using specific aws credentials rather the default. To set-up alternative credentials see http://boto3.readthedocs.org/en/latest/guide/configuration.html#shared-credentials-file')
+parser.add_argument('-n', '--concurrency', type=int, default=1,
+                    help='Number of workers to assign the qualification to in parallel (default: 1)')
+parser.add_argument('-k', '--skipholders', action='store_true',
+                    help='Skip workers who already hold the qualification, according to a cached list of holders')
+parser.add_argument('--refresh', choices=REFRESH_MODES, default='incremental',
+                    help='How to bring the cached list of qualification holders up to date: not at all, by fetching '
+                         'only recent grants, or by fetching every holder (default: incremental)')
+parser.add_argument('--cachedir', default=DEFAULT_CACHE_DIR,
+                    help='Directory for cached lists of qualification holders (default: ~/.mturkutils/qualifications)')
 args = parser.parse_args()
 
 # Only region w/ MTurk endpoint currently is us-east-1
@@ -45,20 +59,44 @@ endpoint = f'https://mturk-requester-sandbox.{region}.amazonaws.com' if args.san
 # If you want to use profiles, you have to create a Session with one before connecting a client
 session = boto3.Session(profile_name=args.profile)
 
-with open(args.resultsfile, 'r') as infile:
-    results = list(DictReader(infile, delimiter='\t'))
+QUALIFICATION_VALUE = 1
 
-mtc = session.client('mturk', endpoint_url=endpoint, region_name=region)
 
-for row in results:
+def assign(workerid: str) -> Tuple[str, bool]:
+    """Assign the qualification to a worker, returning the worker and whether it worked."""
     try:
-        mtc.associate_qualification_with_worker(
+        call_with_backoff(
+            mtc.associate_qualification_with_worker,
             QualificationTypeId=args.qualification,
-            WorkerId=row['workerid'],
-            IntegerValue=1,
+            WorkerId=workerid,
+            IntegerValue=QUALIFICATION_VALUE,
             SendNotification=False
         )
-        print("Assigning {} to {}".format(args.qualification, row['workerid']))
+        return workerid, True
     except ClientError as e:
         print(e)
-        print("Skipping {} for {}".format(args.qualification, row['workerid']))
+        print("Skipping {} for {}".format(args.qualification, workerid))
+        return workerid, False
+
+
+with open(args.resultsfile, 'r') as infile:
+    # a worker who did many assignments only needs the qualification once
+    workers = list(dict.fromkeys(row['workerid'] for row in DictReader(infile, delimiter='\t')))
+
+mtc = session.client('mturk', endpoint_url=endpoint, region_name=region, config=client_config(args.concurrency))
+
+holders = None
+if args.skipholders:
+    holders = get_holders(mtc, args.qualification, args.refresh, args.cachedir)
+    new_workers = [w for w in workers if not holds(holders, w, QUALIFICATION_VALUE)]
+    print(f'{len(workers) - len(new_workers)} of {len(workers)} workers already hold {args.qualification}')
+    workers = new_workers
+
+print("Assigning {} to {} workers".format(args.qualification, len(workers)))
+for workerid, assigned in with_progress(iter_concurrently(assign, workers, args.concurrency), len(workers),
+                                        'Assigned', succeeded=lambda r: r[1]):
+    if assigned and holders is not None:
+        add_holder(holders, workerid, QUALIFICATION_VALUE)
+
+if holders is not None:
+    save_cache(holders, args.cachedir)
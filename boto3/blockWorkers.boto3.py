@@ -22,18 +22,65 @@
 #
 
 import argparse
+import json
+import os
 from csv import DictReader
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
 
 import boto3
 
 from botocore.exceptions import ClientError
 
+from concurrency import call_with_backoff, client_config, iter_concurrently, with_progress
+
+from pagination import paginate
+
 __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 
+
+def load_blocks(filename: str, max_age: timedelta) -> Optional[Dict]:
+    """Read the cached block list, or None if there isn't one or it's older than max_age."""
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r') as cachefile:
+        cache = json.load(cachefile)
+    if datetime.now(timezone.utc) - datetime.fromisoformat(cache['fetched']) > max_age:
+        return None
+    return cache
+
+
+def save_blocks(filename: str, cache: Dict):
+    """Write the cached block list, replacing the old file only once the new one is complete."""
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename + '.tmp', 'w') as cachefile:
+        json.dump(cache, cachefile)
+    os.replace(filename + '.tmp', filename)
+
+
+def block(item: Tuple[str, str]) -> Tuple[str, str, bool]:
+    """Block a worker, returning the worker, the reason and whether it worked."""
+    workerid, reason = item
+    try:
+        call_with_backoff(mtc.create_worker_block, WorkerId=workerid, Reason=reason)
+        return workerid, reason, True
+    except ClientError as e:
+        print(e)
+        return workerid, reason, False
+
+
 parser = argparse.ArgumentParser(description='Block a worker from doing your HITs on Amazon Mechanical Turk')
-parser.add_argument('-blockfile', required=True, help="(required) File with comma separated 'worker' and 'reason' columns")
+parser.add_argument('-blockfile', required=True, help="(required) File with comma separated 'workerid' and 'reason' columns")
+parser.add_argument('-s', '--sandbox', action='store_true',
+                    help='Run the command in the Mechanical Turk Sandbox (used for testing purposes)')
 parser.add_argument('-p', '--profile',
         help='Run commands using specific aws credentials rather the default. To set-up alternative credentials see http://boto3.readthedocs.org/en/latest/guide/configuration.html#shared-credentials-file')
+parser.add_argument('-n', '--concurrency', type=int, default=1,
+                    help='Number of workers to block in parallel (default: 1)')
+parser.add_argument('--refresh', action='store_true',
+                    help='Fetch the current block list from MTurk even if the cached copy is recent')
+parser.add_argument('--maxage', type=float, default=24,
+                    help='Hours before the cached block list is considered stale and fetched again (default: 24)')
 args = parser.parse_args()
 
 # Only region w/ MTurk endpoint currently is us-east-1
@@ -42,15 +89,33 @@ endpoint = f'https://mturk-requester-sandbox.{region}.amazonaws.com' if args.san
 # If you want to use profiles, you have to create a Session with one before connecting a client
 session = boto3.Session(profile_name=args.profile)
 
-mtc = session.client('mturk', endpoint_url=endpoint, region_name=region)
+mtc = session.client('mturk', endpoint_url=endpoint, region_name=region, config=client_config(args.concurrency))
+
+# worker IDs are the same in the sandbox, but blocks aren't, so keep separate caches
+cache_name = os.path.join(os.path.expanduser('~'), '.mturkutils',
+                          'blocks-{}-{}.json'.format('sandbox' if args.sandbox else 'production',
+                                                     args.profile or 'default'))
 
 with open(args.blockfile, 'r') as blockfile:
+    # the first reason given wins if a worker is listed more than once
+    to_block = {}
     for row in DictReader(blockfile):
-        try:
-            print(f'Blocking {row["workerid"]} for {row["reason"]}')
-            mtc.create_worker_block(
-                WorkerId=row['workerid'],
-                Reason=row['reason']
-            )
-        except ClientError as e:
-            print(e)
+        to_block.setdefault(row['workerid'], row['reason'])
+
+cache = None if args.refresh else load_blocks(cache_name, timedelta(hours=args.maxage))
+if cache is None:
+    print('Fetching current block list')
+    cache = {'fetched': datetime.now(timezone.utc).isoformat(), 'blocks': {}}
+    for page in paginate(mtc.list_worker_blocks, 'WorkerBlocks'):
+        cache['blocks'].update({b['WorkerId']: b.get('Reason', '') for b in page})
+blocks = cache['blocks']
+
+new_blocks = [(w, r) for w, r in to_block.items() if w not in blocks]
+print(f'{len(to_block) - len(new_blocks)} of {len(to_block)} workers are already blocked')
+
+for workerid, reason, blocked in with_progress(iter_concurrently(block, new_blocks, args.concurrency),
+                                               len(new_blocks), 'Blocked', succeeded=lambda r: r[2]):
+    if blocked:
+        blocks[workerid] = reason
+
+save_blocks(cache_name, cache)
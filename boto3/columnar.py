@@ -0,0 +1,82 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Write results and HIT listings as typed Parquet or Feather files instead of delimited text."""
+
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Optional
+
+import pandas as pd
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+COLUMNAR_FORMATS = ('parquet', 'feather')
+
+# column types for the results files written by getResults
+RESULTS_DATETIMES = ('creationtime', 'hitlifetime', 'autoapprovaltime', 'assignmentaccepttime',
+                     'assignmentsubmittime', 'assignmentapprovaltime', 'assignmentrejecttime', 'deadline')
+RESULTS_DECIMALS = ('reward',)
+RESULTS_INTEGERS = ('assignments', 'numavailable', 'numpending', 'numcomplete', 'assignmentduration',
+                    'autoapprovaldelay')
+
+# column types for the HIT listings written by getAllHits
+HIT_DATETIMES = ('CreationTime', 'Expiration')
+HIT_DECIMALS = ('Reward',)
+HIT_INTEGERS = ('AutoApprovalDelayInSeconds', 'AssignmentDurationInSeconds', 'NumberOfAssignmentsAvailable',
+                'NumberOfAssignmentsCompleted', 'NumberOfAssignmentsPending', 'MaxAssignments')
+
+
+def to_decimal(value) -> Optional[Decimal]:
+    """Turn a reward like '0.50' or '$0.50' into a Decimal, or None if it's missing."""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    try:
+        return Decimal(str(value).lstrip('$'))
+    except InvalidOperation:
+        return None
+
+
+def typed_frame(df: pd.DataFrame, datetimes: Iterable[str]=(), decimals: Iterable[str]=(),
+                integers: Iterable[str]=()) -> pd.DataFrame:
+    """Convert the named columns of a DataFrame of strings to timestamps, decimals and nullable integers."""
+    for col in datetimes:
+        if col in df:
+            df[col] = pd.to_datetime(df[col], utc=True, errors='coerce')
+    for col in decimals:
+        if col in df:
+            df[col] = df[col].map(to_decimal)
+    for col in integers:
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+    return df
+
+
+def write_frame(df: pd.DataFrame, filename: str, fmt: str):
+    """Write a DataFrame as Parquet or Feather. Both need pyarrow."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise SystemExit(f'You must have pyarrow installed to write {fmt} files.')
+    if fmt == 'parquet':
+        df.to_parquet(filename, index=False)
+    elif fmt == 'feather':
+        df.reset_index(drop=True).to_feather(filename)
+    else:
+        raise ValueError(f'Unknown columnar format: {fmt}')
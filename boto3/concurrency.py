@@ -0,0 +1,157 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Run MTurk API calls from a bounded pool of threads without tripping the rate limiter."""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from botocore.config import Config
+
+from botocore.exceptions import ClientError
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+# MTurk doesn't use one consistent error code when it throttles requests
+THROTTLE_CODES = {'Throttling', 'ThrottlingException', 'ServiceUnavailable', 'ServiceUnavailableException',
+                  'TooManyRequestsException'}
+
+
+def client_config(concurrency: int=1) -> Config:
+    """
+    Create a botocore Config for a client that will be shared by `concurrency` threads.
+
+    botocore's 'adaptive' retry mode slows the whole client down when it sees throttling responses,
+    so all threads back off together instead of each hammering the endpoint on its own.
+    """
+    return Config(max_pool_connections=max(10, concurrency),
+                  retries={'max_attempts': 10, 'mode': 'adaptive'})
+
+
+def is_throttled(e: ClientError) -> bool:
+    """Whether a ClientError means we are sending requests too fast."""
+    error = e.response.get('Error', {})
+    return error.get('Code') in THROTTLE_CODES or 'rate exceeded' in error.get('Message', '').lower()
+
+
+def call_with_backoff(func: Callable, *args, max_tries: int=8, base_delay: float=0.5, max_delay: float=30.0,
+                      **kwargs) -> Any:
+    """
+    Call `func`, retrying with exponential backoff and full jitter while MTurk throttles us.
+
+    This catches the throttling errors botocore's own retry handler doesn't recognize. Any other
+    ClientError, or throttling that outlasts `max_tries`, is raised to the caller.
+    """
+    for attempt in range(max_tries):
+        try:
+            return func(*args, **kwargs)
+        except ClientError as e:
+            if not is_throttled(e) or attempt == max_tries - 1:
+                raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+def rate_limited(func: Callable, per_second: float) -> Callable:
+    """Wrap `func` so that calls to it, from however many threads, start at most `per_second` times a second."""
+    lock = threading.Lock()
+    interval = 1.0 / per_second
+    next_start = [time.monotonic()]
+
+    def wrapper(*args, **kwargs):
+        with lock:
+            now = time.monotonic()
+            start = max(now, next_start[0])
+            next_start[0] = start + interval
+        if start > now:
+            time.sleep(start - now)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def with_progress(results: Iterable, total: int, label: str, every: float=5.0,
+                  succeeded: Optional[Callable[[Any], bool]]=None) -> Iterator:
+    """
+    Pass results through, printing how many are done and the rate at most every `every` seconds.
+
+    If `succeeded` is given, only results it returns True for count as done, and the rest as failed.
+    """
+    start = last = time.monotonic()
+    seen = done = 0
+    for result in results:
+        yield result
+        seen += 1
+        if succeeded is None or succeeded(result):
+            done += 1
+        now = time.monotonic()
+        if now - last >= every or seen == total:
+            failed = f', {seen - done} failed' if seen > done else ''
+            print(f'{label} {done}/{total}{failed} ({done / max(now - start, 1e-6):.1f}/s)')
+            last = now
+
+
+def iter_concurrently(func: Callable, items: Iterable, concurrency: int=1) -> Iterator:
+    """
+    Apply `func` to every item using up to `concurrency` threads, yielding results in input order.
+
+    Only a small window of calls is submitted ahead of the result being consumed, so finished results
+    don't pile up in memory while waiting on a slow call earlier in the order.
+    """
+    if concurrency <= 1:
+        yield from map(func, items)
+        return
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= concurrency * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_completed(func: Callable, items: Iterable, concurrency: int=1) -> Iterator:
+    """
+    Apply `func` to every item using up to `concurrency` threads, yielding results as soon as each finishes.
+
+    Use this rather than iter_concurrently when each result has to be recorded the moment its call
+    succeeds, e.g. in a journal, so that nothing already done is lost if the run is killed.
+    """
+    if concurrency <= 1:
+        yield from map(func, items)
+        return
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+        for item in items:
+            pending.add(executor.submit(func, item))
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def run_concurrently(func: Callable, items: Iterable, concurrency: int=1) -> List:
+    """Apply `func` to every item using up to `concurrency` threads, returning results in input order."""
+    return list(iter_concurrently(func, items, concurrency))
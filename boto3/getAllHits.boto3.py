@@ -23,8 +23,10 @@
 
 
 import argparse
+import re
 from collections import Counter
 from datetime import datetime
+from typing import Dict, List
 
 import boto3
 
@@ -36,6 +38,10 @@ from ruamel.yaml import dump
 
 from xmltodict import parse as parse_xml
 
+from columnar import HIT_DATETIMES, HIT_DECIMALS, HIT_INTEGERS, typed_frame, write_frame
+
+from pagination import paginate, timing_summary
+
 
 def extract_hit_url(row):
     """
@@ -54,6 +60,27 @@ def extract_hit_url(row):
     except KeyError:
         return row
 
+
+def parse_time(value: str) -> datetime:
+    """Parse an ISO 8601 date/time from the command line, taking times without a timezone as local."""
+    return datetime.fromisoformat(value).astimezone()
+
+
+def hit_matches(hit: Dict) -> bool:
+    """Whether a HIT passes every filter given on the command line."""
+    if args.status and hit['HITStatus'] not in args.status:
+        return False
+    if args.hittypeid and hit['HITTypeId'] not in args.hittypeid:
+        return False
+    if args.title and not args.title.search(hit['Title']):
+        return False
+    if args.after and hit['CreationTime'] < args.after:
+        return False
+    if args.before and hit['CreationTime'] >= args.before:
+        return False
+    return True
+
+
 __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 
 parser = argparse.ArgumentParser(description='Get all current HITs for an account and dump to a CSV file.')
@@ -61,6 +88,18 @@ parser.add_argument('-s', '--sandbox', action='store_true',
                     help='Run the command in the Mechanical Turk Sandbox (used for testing purposes)')
 parser.add_argument('-p', '--profile',
         help='Run commands using specific aws credentials rather the default. To set-up alternative credentials see http://boto3.readthedocs.org/en/latest/guide/configuration.html#shared-credentials-file')
+parser.add_argument('-t', '--format', choices=('csv', 'parquet', 'feather'), default='csv',
+                    help='Format of the output file. parquet and feather files have typed columns. (default: csv)')
+parser.add_argument('--status', nargs='+',
+                    choices=('Assignable', 'Unassignable', 'Reviewable', 'Reviewing', 'Disposed'),
+                    help='Only include HITs with one of these statuses')
+parser.add_argument('--hittypeid', nargs='+', help='Only include HITs with one of these HITTypeIds')
+parser.add_argument('--title', type=re.compile, help='Only include HITs whose title matches this regular expression')
+parser.add_argument('--after', type=parse_time,
+                    help='Only include HITs created at or after this ISO 8601 time, e.g. 2018-03-01T09:00. '
+                         'Listing stops as soon as older HITs are reached.')
+parser.add_argument('--before', type=parse_time, help='Only include HITs created before this ISO 8601 time')
+parser.add_argument('--timing', action='store_true', help='Report how many pages were requested and how long they took')
 args = parser.parse_args()
 
 # Only region w/ MTurk endpoint currently is us-east-1
@@ -71,18 +110,6 @@ session = boto3.Session(profile_name=args.profile)
 
 mtc = session.client('mturk', endpoint_url=endpoint, region_name=region)
 
-try:
-    all_hits = []
-    num_results = 10  # fake number of results so loop executes at least once
-    next_token = None
-    while num_results >= 10:  # 10 is the max you get at once
-        hit_batch = mtc.list_hits(NextToken=next_token) if next_token else mtc.list_hits()
-        num_results = hit_batch['NumResults']
-        next_token = hit_batch['NextToken']
-        all_hits.extend(hit_batch['HITs'])
-except ClientError as e:
-    print(e)
-
 hit_keys = ('HITTypeId', 'HITGroupId', 'HITId', 'HITStatus', 'HITReviewStatus',
             'Title', 'Question', 'Description', 'Keywords', 'Reward',
             'CreationTime', 'AutoApprovalDelayInSeconds', 'AssignmentDurationInSeconds',
@@ -90,14 +117,57 @@ hit_keys = ('HITTypeId', 'HITGroupId', 'HITId', 'HITStatus', 'HITReviewStatus',
             'NumberOfAssignmentsCompleted', 'NumberOfAssignmentsPending',
             'MaxAssignments', 'QualificationRequirements')
 
-hit_df = pd.DataFrame([{k: h[k] for k in h.keys() & set(hit_keys)} for h in all_hits])
-hit_df['Question'] = hit_df['Question'].apply(extract_hit_url)
-hit_df['QualificationRequirements'] = hit_df['QualificationRequirements'].apply(dump)
 
-print(f'{len(all_hits)} current HITs')
-for k, v in Counter([h['HITStatus'] for h in all_hits]).items():
-    print(f'{k}: {v}')
+def hit_frame(hits: List[Dict]) -> pd.DataFrame:
+    """Turn a list of HITs into a DataFrame with one row per HIT and readable Question/Qualification columns."""
+    hit_df = pd.DataFrame([{k: h[k] for k in h.keys() & set(hit_keys)} for h in hits]).reindex(columns=hit_keys)
+    hit_df['Question'] = hit_df['Question'].apply(extract_hit_url)
+    hit_df['QualificationRequirements'] = hit_df['QualificationRequirements'].apply(dump)
+    return hit_df
+
 
-outfile_name = 'all_hits-{}.csv'.format(datetime.now().isoformat())
+outfile_name = 'all_hits-{}.{}'.format(datetime.now().isoformat(), args.format)
 print(f'Writing out "{outfile_name}"')
-hit_df.to_csv(outfile_name, index=False, columns=hit_keys)
+
+status_counts = Counter()
+kept_hits = []  # only needed for the columnar formats, which can't be appended to
+wrote_header = False
+newest_first = True
+last_created = None
+page_timings = []
+try:
+    for page in paginate(mtc.list_hits, 'HITs', page_timings):
+        matching = [h for h in page if hit_matches(h)]
+        status_counts.update(h['HITStatus'] for h in matching)
+        if matching and args.format == 'csv':
+            # write each page as it arrives so huge accounts don't have to be held in memory
+            hit_frame(matching).to_csv(outfile_name, mode='a', header=not wrote_header, index=False,
+                                       columns=hit_keys)
+            wrote_header = True
+        elif matching:
+            kept_hits.extend(matching)
+
+        for h in page:
+            if last_created and h['CreationTime'] > last_created:
+                newest_first = False
+            last_created = h['CreationTime']
+        # list_hits returns the newest HITs first, so once we're past the start of the window nothing
+        # later can match. Only rely on that for as long as the order we're actually seeing agrees.
+        if args.after and newest_first and last_created and last_created < args.after:
+            print('Reached HITs created before --after; stopping')
+            break
+except ClientError as e:
+    print(e)
+
+if args.timing:
+    print(timing_summary(page_timings))
+
+print(f'{sum(status_counts.values())} current HITs')
+for k, v in status_counts.items():
+    print(f'{k}: {v}')
+
+if args.format == 'csv' and not wrote_header:
+    hit_frame([]).to_csv(outfile_name, index=False, columns=hit_keys)
+elif args.format != 'csv':
+    hit_df = typed_frame(hit_frame(kept_hits), HIT_DATETIMES, HIT_DECIMALS, HIT_INTEGERS)
+    write_frame(hit_df, outfile_name, args.format)
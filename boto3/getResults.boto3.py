@@ -21,8 +21,10 @@
 # SOFTWARE.
 
 import argparse
+import json
+import tempfile
 
-from typing import Dict, Tuple, Set
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Set
 
 import boto3
 
@@ -30,92 +32,67 @@ from ruamel.yaml import load, CLoader
 
 from unicodecsv import DictWriter
 
-import xmltodict
+from concurrency import call_with_backoff, client_config, iter_concurrently, run_concurrently
+
+from pagination import paginate, timing_summary
+
+from result_rows import hit_row, process_assignment
+
+from results_store import hit_state, open_store, save_hit, stored_keys, stored_rows, stored_state
 
 __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 
 
-def manage_url(hitid: str, sandbox: bool=False) -> str:
-    mturk_website = 'requestersandbox.mturk.com' if sandbox else 'requester.mturk.com'
-    return 'https://{}/mturk/manageHIT?HITId={}'.format(
-        mturk_website, hitid)
-
-
-def process_assignment(assignment: dict, hitinfo: dict, sandbox: bool=False) -> Tuple[Dict[str, str], Set]:
-    """Turn an Assignment dict as returned by boto3 into a row for results file."""
-    optional_assignment_keys = {
-        'AcceptTime': 'assignmentaccepttime', 'RejectTime': 'assignmentrejecttime', 'Deadline': 'deadline',
-        'RequesterFeedback': 'feedback', 'ApprovalTime': 'assignmentapprovaltime'
-    }
-    print(f'Processing AssignmentId: {assignment["AssignmentId"]} for Worker: {assignment["WorkerId"]}')
-    row: Dict[str, str] = {
-        'assignmentid': assignment['AssignmentId'],
-        'assignmentstatus': assignment['AssignmentStatus'],
-        'autoapprovaltime': assignment['AutoApprovalTime'],
-        'hitid': assignment['HITId'],
-        'viewhit': manage_url(assignment['HITId'], sandbox),
-        'assignmentsubmittime': assignment['SubmitTime'],
-        'workerid': assignment['WorkerId'],
-        # these assignment keys are optional
-        'assignmentaccepttime': '',
-        'assignmentapprovaltime': '',
-        'assignmentrejecttime': '',
-        'deadline': '',
-        'feedback': '',
-        # 'reject' is for processing results files to mark which rows are to be rejected with an x
-        'reject': '',
-        # HIT keys.
-        'hittypeid': hitinfo['HITTypeId'],
-        'hitgroupid': hitinfo['HITGroupId'],
-        'title': hitinfo['Title'],
-        'description': hitinfo['Description'],
-        'keywords': hitinfo['Keywords'],
-        'reward': '$' + hitinfo['Reward'],
-        'creationtime': hitinfo['CreationTime'],
-        'assignments': hitinfo['MaxAssignments'],
-        'numavailable': hitinfo['NumberOfAssignmentsAvailable'],
-        'numpending': hitinfo['NumberOfAssignmentsPending'],
-        'numcomplete': hitinfo['NumberOfAssignmentsCompleted'],
-        'hitstatus': hitinfo['HITStatus'],
-        'reviewstatus': hitinfo['HITReviewStatus'],
-        'assignmentduration': hitinfo['AssignmentDurationInSeconds'],
-        'autoapprovaldelay': hitinfo['AutoApprovalDelayInSeconds'],
-        'hitlifetime': hitinfo['Expiration'],
-        'annotation': ''
-    }
-
-    # populate the optional keys if they exist
-    for k, v in optional_assignment_keys.items():
-        if k in assignment:
-            row[v] = assignment[k]
-
-    assignment_keys = set()
-    if 'QualificationRequirements' in hitinfo:
-        for i, qual in enumerate(['|'.join(['{}:{}'.format(k, v) for k, v in x.items()]) for x in hitinfo['QualificationRequirements']]):
-            qualkey = 'Qualification.{}'.format(i)
-            row[qualkey] = qual
-            assignment_keys.add(qualkey)
-
-    if 'RequesterAnnotation' in hitinfo:
-        row['annotation'] = hitinfo['RequesterAnnotation']
-
-    # answers are in assignment['Answer'] as an MTurk QuestionFormAnswers XML string
-    ordered_answers = xmltodict.parse(assignment.get('Answer')).get('QuestionFormAnswers').get('Answer')
-    # FIXME: answer might not be FreeText, but that's what I'm handling for now
-    # Other possibilities are:
-    #    sequence of "SelectionIdentifier" and/or "OtherSelectionText"
-    #    sequence of "UploadedFileSizeInBytes" and "UploadedFileKey"
-    # http://docs.aws.amazon.com/AWSMechTurk/latest/AWSMturkAPI/ApiReference_QuestionFormAnswersDataStructureArticle.html
-    # http://mechanicalturk.amazonaws.com/AWSMechanicalTurkDataSchemas/2005-10-01/QuestionFormAnswers.xsd
-
-    # Sometimes you get a list or OrderedDicts, sometimes a single OrderedDict
-    if issubclass(ordered_answers.__class__, dict):
-        user_answers = {f"Answer.{ordered_answers['QuestionIdentifier']}": ordered_answers['FreeText']}
-    else:
-        user_answers = {f"Answer.{d['QuestionIdentifier']}": d['FreeText'] for d in ordered_answers}
-    assignment_keys.update(set(user_answers.keys()))
-    row.update(user_answers)
-    return row, assignment_keys
+def fetch_hitinfo(hitid: str) -> dict:
+    """Get the HIT."""
+    print(f'Fetching HIT: {hitid}')
+    return call_with_backoff(mtc.get_hit, HITId=hitid).get('HIT')
+
+
+def fetch_assignments(hitid: str) -> List[dict]:
+    """Get all of the assignments for a HIT."""
+    assignments = []
+    for page in paginate(mtc.list_assignments_for_hit, 'Assignments', page_timings, HITId=hitid):
+        assignments.extend(page)
+    return assignments
+
+
+def fetch_hit(hitid: str) -> Tuple[dict, List[dict]]:
+    """Get the HIT and all of its assignments."""
+    return fetch_hitinfo(hitid), fetch_assignments(hitid)
+
+
+def write_results(rows: Iterable[Tuple[Dict, Set]], resultsfile: str, outkeys: List[str],
+                  answer_keys: Optional[Iterable[str]]=None) -> int:
+    """
+    Write rows to a tab delimited results file as they arrive, returning how many were written.
+
+    If the answer columns aren't known ahead of time, rows are spilled to a temporary file while the
+    set of columns is collected, and then copied into the results file once the header is known.
+    """
+    count = 0
+    if answer_keys is not None:
+        with open(resultsfile, 'wb') as outfile:
+            dw = DictWriter(outfile, fieldnames=outkeys + list(answer_keys), delimiter='\t', extrasaction='ignore')
+            dw.writeheader()
+            for row, _ in rows:
+                dw.writerow(row)
+                count += 1
+        return count
+
+    seen_keys = set()
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as spill:
+        for row, assignment_keys in rows:
+            spill.write(json.dumps(row, default=str) + '\n')
+            seen_keys.update(assignment_keys)
+            count += 1
+        spill.seek(0)
+        with open(resultsfile, 'wb') as outfile:
+            dw = DictWriter(outfile, fieldnames=outkeys + sorted(seen_keys), delimiter='\t')
+            dw.writeheader()
+            for line in spill:
+                dw.writerow(json.loads(line))
+    return count
 
 
 parser = argparse.ArgumentParser(description='Get results from Amazon Mechanical Turk')
@@ -125,6 +102,19 @@ parser.add_argument('-s', '--sandbox', action='store_true',
                     help='Run the command in the Mechanical Turk Sandbox (used for testing purposes)')
 parser.add_argument('-p', '--profile',
                     help='Run commands using specific aws credentials rather the default. To set-up alternative credentials see http://boto3.readthedocs.org/en/latest/guide/configuration.html#shared-credentials-file')
+parser.add_argument('-n', '--concurrency', type=int, default=1,
+                    help='Number of HITs to fetch in parallel (default: 1)')
+parser.add_argument('-i', '--store',
+                    help='SQLite file to keep results in between runs. Only HITs that changed since the last run '
+                         'have their assignments fetched again.')
+parser.add_argument('-k', '--answerkeys', nargs='+',
+                    help='Answer and qualification columns to write, e.g. Answer.comments Qualification.0. '
+                         'Rows are written straight to the results file and any other columns are dropped.')
+parser.add_argument('-t', '--format', choices=('tsv', 'parquet', 'feather'), default='tsv',
+                    help='Format of the results file. parquet and feather files have typed columns, but every row '
+                         'is held in memory until it is written. (default: tsv)')
+parser.add_argument('--timing', action='store_true',
+                    help='Report how many pages of assignments were requested and how long they took')
 args = parser.parse_args()
 
 # Only region w/ MTurk endpoint currently is us-east-1
@@ -137,9 +127,8 @@ print('Loaded successfile')
 
 # If you want to use profiles, you have to create a Session with one before connecting a client
 session = boto3.Session(profile_name=args.profile)
-mtc = session.client('mturk', endpoint_url=endpoint, region_name=region)
+mtc = session.client('mturk', endpoint_url=endpoint, region_name=region, config=client_config(args.concurrency))
 
-all_results = []
 outkeys = ['hitid', 'hittypeid', 'hitgroupid', 'title', 'description', 'keywords', 'reward',
            'creationtime', 'assignments', 'numavailable', 'numpending', 'numcomplete',
            'hitstatus', 'reviewstatus', 'annotation', 'assignmentduration',
@@ -147,29 +136,64 @@ outkeys = ['hitid', 'hittypeid', 'hitgroupid', 'title', 'description', 'keywords
            'assignmentstatus', 'autoapprovaltime', 'assignmentaccepttime',
            'assignmentsubmittime', 'assignmentapprovaltime', 'assignmentrejecttime',
            'deadline', 'feedback', 'reject']
-answer_keys = set()
-
-hits = {h['HITId']: mtc.get_hit(HITId=h['HITId']).get('HIT') for h in hitdata}
-
-print('Processing results')
-for h in hitdata:
-    print(f'Processing HIT: {h["HITId"]}')
-    response = mtc.list_assignments_for_hit(HITId=h['HITId'])
-    assignments = response.get('Assignments')
-    while response.get('NumResults', 0) >= 10:  # I assume 10 is the biggest number they show, but it'd be nice if it decreased
-        response = mtc.list_assignments_for_hit(HITId=h['HITId'], NextToken=response.get('NextToken'))
-        assignments.extend(response.get('Assignments'))
-    for assignment in assignments:
-        row, assignment_keys = process_assignment(assignment, hits[h['HITId']], args.sandbox)
-        all_results.append(row)
-        answer_keys.update(assignment_keys)
 
-outkeys.extend(list(sorted(answer_keys)))
+hitids = [h['HITId'] for h in hitdata]
+page_timings = []
 
-print(f'Writing {len(all_results)} results')
-with open(args.resultsfile, 'wb') as outfile:
-    dw = DictWriter(outfile, fieldnames=outkeys, delimiter='\t')
-    dw.writeheader()
 
-    for row in all_results:
-        dw.writerow(row)
+def assignment_rows(hitinfo: dict, assignments: List[dict]) -> Iterator[Tuple[Dict, Set]]:
+    """Yield a row for each of a HIT's assignments."""
+    print(f'Processing HIT: {hitinfo["HITId"]}')
+    # the HIT columns are the same for every assignment, so only build them once
+    template = hit_row(hitinfo, args.sandbox)
+    for assignment in assignments:
+        print(f'Processing AssignmentId: {assignment["AssignmentId"]} for Worker: {assignment["WorkerId"]}')
+        yield process_assignment(assignment, template)
+
+
+def fetched_rows() -> Iterator[Tuple[Dict, Set]]:
+    """Yield a row for every assignment of every HIT, fetching HITs as they're needed."""
+    # the get_hit and list_assignments_for_hit calls for different HITs don't depend on each other, so overlap them
+    for hitinfo, assignments in iter_concurrently(fetch_hit, hitids, args.concurrency):
+        yield from assignment_rows(hitinfo, assignments)
+
+
+if args.store:
+    store = open_store(args.store)
+    hitinfos = run_concurrently(fetch_hitinfo, hitids, args.concurrency)
+    changed = [h for h in hitinfos if hit_state(h) != stored_state(store, h['HITId'])]
+    print(f'{len(changed)} of {len(hitinfos)} HITs changed since last run')
+    changed_assignments = iter_concurrently(fetch_assignments, [h['HITId'] for h in changed], args.concurrency)
+
+    print('Processing results')
+    for hitinfo, assignments in zip(changed, changed_assignments):
+        save_hit(store, hitinfo['HITId'], hit_state(hitinfo), assignment_rows(hitinfo, assignments))
+    # the store already knows every column, so there's no need to spill
+    answer_keys = args.answerkeys or sorted(stored_keys(store, hitids))
+    results = ((row, set()) for row in stored_rows(store, hitids))
+else:
+    print('Processing results')
+    answer_keys = args.answerkeys
+    results = fetched_rows()
+
+print(f'Writing results to {args.resultsfile}')
+if args.format == 'tsv':
+    count = write_results(results, args.resultsfile, outkeys, answer_keys)
+else:
+    # pandas and pyarrow are only needed for the columnar formats
+    import pandas as pd
+    from columnar import RESULTS_DATETIMES, RESULTS_DECIMALS, RESULTS_INTEGERS, typed_frame, write_frame
+
+    rows = []
+    seen_keys = set()
+    for row, assignment_keys in results:
+        rows.append(row)
+        seen_keys.update(assignment_keys)
+    columns = outkeys + (list(answer_keys) if answer_keys is not None else sorted(seen_keys))
+    results_df = typed_frame(pd.DataFrame(rows, columns=columns),
+                             RESULTS_DATETIMES, RESULTS_DECIMALS, RESULTS_INTEGERS)
+    write_frame(results_df, args.resultsfile, args.format)
+    count = len(results_df)
+print(f'Wrote {count} results')
+if args.timing:
+    print(timing_summary(page_timings))
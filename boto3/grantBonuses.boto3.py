@@ -26,22 +26,95 @@ as generated by calculate_bonus.py
 """
 
 import argparse
-
+import hashlib
+import os
+import sys
 from csv import DictReader
 from functools import reduce
 from operator import add
+from typing import Dict, Set, Tuple
 
 import boto3
 
 from botocore.exceptions import ClientError
 
+from concurrency import call_with_backoff, client_config, iter_completed, with_progress
+
+# the action journal is shared with the original boto scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from action_journal import BONUS, DEFAULT_JOURNAL, journal_entries, open_journal, record  # noqa: E402
+
 __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 
+# what MTurk answers a request whose UniqueRequestToken it has already seen with
+DUPLICATE_REQUEST = 'AWS.MechanicalTurk.DuplicateRequest'
+
+
+def bonus_amount(row: Dict[str, str]) -> str:
+    return f'{float(row["bonus"]):.2f}'
+
+
+def bonus_reason(row: Dict[str, str]) -> str:
+    return f'For doing {row["trials"]} HITs'
+
+
+def request_token(experiment: str, worker_id: str, assignment_id: str, amount: str, reason: str) -> str:
+    """
+    Derive the UniqueRequestToken for a bonus.
+
+    The same bonus always gets the same token, so MTurk refuses to pay it twice even if the request is
+    retried or the whole script is run again (for the 24 hours MTurk remembers tokens). A corrected
+    bonus, with a different amount or reason, gets a new token.
+    """
+    return hashlib.sha256(f'{experiment}:{worker_id}:{assignment_id}:{amount}:{reason}'.encode('utf-8')).hexdigest()
+
+
+def is_duplicate(e: ClientError) -> bool:
+    """Whether MTurk refused a request because one with the same UniqueRequestToken already went through."""
+    return DUPLICATE_REQUEST in (e.response.get('TurkErrorCode'), e.response.get('Error', {}).get('Code'))
+
+
+def paid_bonuses(journal: str) -> Set[Tuple[str, str, str]]:
+    """The (assignment, amount, reason) of every bonus in the journal."""
+    return {(e['assignmentid'], f'{float(e["amount"]):.2f}', e['reason'])
+            for e in journal_entries(journal) if e['action'] == BONUS}
+
+
+def pay(row: Dict[str, str]) -> Tuple[Dict[str, str], str, bool]:
+    """Send one bonus, returning the row, its token and whether it has been paid."""
+    amount, reason = bonus_amount(row), bonus_reason(row)
+    token = request_token(args.experiment, row['worker'], row['assignment'], amount, reason)
+    print(f'Paying ${amount} bonus to {row["worker"]} for {row["trials"]} trials including {row["assignment"]}')
+    try:
+        call_with_backoff(
+            mtc.send_bonus,
+            WorkerId=row['worker'],
+            BonusAmount=amount,
+            AssignmentId=row['assignment'],
+            Reason=reason,
+            UniqueRequestToken=token
+        )
+        return row, token, True
+    except ClientError as e:
+        # a request with this token already went through, e.g. one we timed out waiting on
+        if is_duplicate(e):
+            return row, token, True
+        print(e)
+        return row, token, False
+
+
 parser = argparse.ArgumentParser(description='Grant bonuses for HITs on Amazon Mechanical Turk')
 parser.add_argument('-experiment', required=True,
                     help='(required) The name of the experiment you are granting bonuses for')
+parser.add_argument('-s', '--sandbox', action='store_true',
+                    help='Run the command in the Mechanical Turk Sandbox (used for testing purposes)')
 parser.add_argument('-p', '--profile',
                     help='Run commands using specific aws credentials rather the default. To set-up alternative credentials see http://boto3.readthedocs.org/en/latest/guide/configuration.html#shared-credentials-file')
+parser.add_argument('-n', '--concurrency', type=int, default=1,
+                    help='Number of bonuses to send in parallel (default: 1)')
+parser.add_argument('-j', '--journal', default=DEFAULT_JOURNAL,
+                    help='Journal of every bonus already paid, so re-runs skip them '
+                         '(default: ~/.mturkutils/journal.jsonl)')
 args = parser.parse_args()
 
 # Only region w/ MTurk endpoint currently is us-east-1
@@ -50,37 +123,36 @@ endpoint = f'https://mturk-requester-sandbox.{region}.amazonaws.com' if args.san
 # If you want to use profiles, you have to create a Session with one before connecting a client
 session = boto3.Session(profile_name=args.profile)
 
-mtc = session.client('mturk', endpoint_url=endpoint, region_name=region)
+mtc = session.client('mturk', endpoint_url=endpoint, region_name=region, config=client_config(args.concurrency))
 
 try:
     available_balance = float(mtc.get_account_balance().get('AvailableBalance', 0.0))
     print(f'Available balance: ${available_balance}')
 except ClientError as e:
     print(e)
+    sys.exit(1)
+
+with open('bonus.' + args.experiment + '.csv', 'r') as csvinfile:
+    bonus_list = list(DictReader(csvinfile))
 
-bonus_list = []
-with open('bonus.' + args.expt_name + '.csv', 'r') as csvinfile:
-    bonuses = DictReader(csvinfile)
-    for row in bonuses:
-        bonus_list.append(row)
+paid = paid_bonuses(args.journal)
+unpaid = [row for row in bonus_list if (row['assignment'], bonus_amount(row), bonus_reason(row)) not in paid]
+if len(unpaid) < len(bonus_list):
+    print(f'Skipping {len(bonus_list) - len(unpaid)} bonuses already paid according to {args.journal}')
 
-bonus_sum = reduce(add, [float(x['bonus']) for x in bonus_list])
+bonus_sum = reduce(add, [float(x['bonus']) for x in unpaid], 0.0)
 
 if bonus_sum > available_balance:
     print(f'Insufficient funds (${available_balance:.2f}) to pay bonuses (${bonus_sum:.2f})! Add ${bonus_sum - available_balance :.2f} to your account before proceeding')
 else:
-    for row in bonus_list:
-        price = row['bonus']
-        worker_id = row['worker']
-        assignment_id = row['assignment']
-        trial_count = row['trials']
-        print(f'Paying ${price} bonus to {worker_id} for {trial_count} trials including {assignment_id}')
-        try:
-            mtc.send_bonus(
-                WorkerId=worker_id,
-                BonusAmount='string',
-                AssignmentId=assignment_id,
-                Reason=f'For doing {trial_count} HITs'
-            )
-        except ClientError as e:
-            print(e)  
+    failed = 0
+    with open_journal(args.journal) as journal:
+        # record each bonus the moment it's paid, so a killed run never leaves one out of the journal
+        for row, token, sent in with_progress(iter_completed(pay, unpaid, args.concurrency), len(unpaid), 'Paid',
+                                              succeeded=lambda r: r[2]):
+            if sent:
+                record(journal, BONUS, row['assignment'], worker=row['worker'], amount=bonus_amount(row),
+                       reason=bonus_reason(row), experiment=args.experiment, token=token)
+            else:
+                failed += 1
+    print(f'Paid {len(unpaid) - failed} bonuses, {failed} failed')
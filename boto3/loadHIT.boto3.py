@@ -23,6 +23,10 @@
 """Load HITs to Mechanical Turk."""
 
 import argparse
+import hashlib
+import json
+import os
+import sys
 from datetime import timedelta
 from pprint import pprint
 from typing import Dict, List, Tuple, Union
@@ -35,6 +39,10 @@ from ruamel.yaml import load, safe_dump, CLoader
 
 from xmltodict import unparse
 
+from concurrency import call_with_backoff, client_config, run_concurrently
+
+from qualifications import get_holders
+
 __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 
 
@@ -92,6 +100,30 @@ builtin_requirements = {
     'PercentAssignmentsSubmittedRequirement': '00000000000000000000',
 }
 
+
+def hit_type_key(hit_type: Dict, endpoint: str, profile: str=None) -> str:
+    """Hash HITType attributes together with the endpoint and account profile they were registered under."""
+    blob = json.dumps({'endpoint': endpoint, 'profile': profile, 'hittype': hit_type}, sort_keys=True)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def load_hit_type_cache(cachefile: str) -> Dict[str, str]:
+    """Read the mapping of HITType attribute hashes to HITTypeIds, if there is one."""
+    if not os.path.exists(cachefile):
+        return {}
+    with open(cachefile, 'r') as infile:
+        return load(infile, Loader=CLoader) or {}
+
+
+def save_hit_type_cache(cache: Dict[str, str], cachefile: str):
+    """Write the mapping of HITType attribute hashes to HITTypeIds."""
+    cachedir = os.path.dirname(cachefile)
+    if cachedir:
+        os.makedirs(cachedir, exist_ok=True)
+    with open(cachefile, 'w') as outfile:
+        safe_dump(cache, stream=outfile, default_flow_style=False)
+
+
 parser = argparse.ArgumentParser(description='Load a HIT into Amazon Mechanical Turk')
 parser.add_argument('-c', '--config', required=True, help='YAML file with HIT configuration')
 parser.add_argument('-s', '--sandbox', action='store_true',
@@ -101,6 +133,13 @@ parser.add_argument('-q', '--sqsqueue',
 parser.add_argument('-p', '--profile', help='Run commands using specific aws credentials rather the default.'
                                             'To set-up alternative credentials see '
                                             'http://boto3.readthedocs.org/en/latest/guide/configuration.html#shared-credentials-file')
+parser.add_argument('-n', '--concurrency', type=int, default=1,
+                    help='Number of HITs to create in parallel (default: 1)')
+parser.add_argument('--hittypecache', default=os.path.join(os.path.expanduser('~'), '.mturkutils', 'hittypes.yaml'),
+                    help='YAML file caching HITTypeIds already registered (default: ~/.mturkutils/hittypes.yaml)')
+parser.add_argument('--qualsummary', action='store_true',
+                    help='Before loading, report how many workers hold each custom qualification, using the local '
+                         'cache of qualification holders (refreshed incrementally)')
 args = parser.parse_args()
 
 with open(args.config, 'r') as hitfile:
@@ -116,7 +155,6 @@ for k in required_keys:
         abort = True
 if abort:
     print('At least one required key missing; aborting HIT load')
-    import sys
     sys.exit()
 
 if 'input' in hitdata['question']:
@@ -172,7 +210,13 @@ endpoint = 'https://mturk-requester-sandbox.us-east-1.amazonaws.com' if args.san
 # If you want to use profiles, you have to create a Session with one before connecting a client
 session = boto3.Session(profile_name=args.profile)
 # Only region w/ MTurk endpoint currently is us-east-1
-mtc = session.client('mturk', endpoint_url=endpoint, region_name='us-east-1')
+mtc = session.client('mturk', endpoint_url=endpoint, region_name='us-east-1',
+                     config=client_config(args.concurrency))
+
+if args.qualsummary:
+    for c in hitdata['qualifications'].get('custom', []):
+        holders = get_holders(mtc, c['qualification'])
+        print(f"{c['qualification']} ({c['comparator']}): held by {len(holders['workers'])} workers")
 
 # Time defaults in boto are WAY too long
 duration = timedelta(minutes=60).total_seconds()
@@ -186,25 +230,53 @@ if 'autoapprovaldelay' in hitdata:
     approvaldelay = timedelta(seconds=hitdata['autoapprovaldelay']).total_seconds()
 
 
-created_hits = []
-for q in questions:
+# Everything but the question and assignment/lifetime settings is shared by every HIT, so register
+# it once as a HITType and reuse that, both within this load and in any later load of the same config
+hit_type = {
+    'AutoApprovalDelayInSeconds': int(approvaldelay),
+    'AssignmentDurationInSeconds': int(duration),
+    'Reward': f"{hitdata['reward']:.2f}",
+    'Title': hitdata['title'],
+    'Keywords': format_keywords(hitdata['keywords']),
+    'Description': hitdata['description'],
+    'QualificationRequirements': qualifications
+}
+hit_type_cache = load_hit_type_cache(args.hittypecache)
+cache_key = hit_type_key(hit_type, endpoint, args.profile)
+if cache_key in hit_type_cache:
+    hit_type_id = hit_type_cache[cache_key]
+    print(f'Reusing HITTypeId {hit_type_id}')
+else:
     try:
-        hit = mtc.create_hit(
+        hit_type_id = call_with_backoff(mtc.create_hit_type, **hit_type)['HITTypeId']
+    except ClientError as e:
+        print(e)
+        print('Unable to register HITType; aborting HIT load')
+        sys.exit()
+    print(f'Registered HITTypeId {hit_type_id}')
+    hit_type_cache[cache_key] = hit_type_id
+    save_hit_type_cache(hit_type_cache, args.hittypecache)
+
+
+def create_hit(question: str) -> Dict:
+    """Create a single HIT for a question, returning an empty dict if it failed."""
+    try:
+        hit = call_with_backoff(
+            mtc.create_hit_with_hit_type,
+            HITTypeId=hit_type_id,
             MaxAssignments=hitdata['assignments'],
-            AutoApprovalDelayInSeconds=int(approvaldelay),
             LifetimeInSeconds=int(lifetime),
-            AssignmentDurationInSeconds=int(duration),
-            Reward=f"{hitdata['reward']:.2f}",
-            Title=hitdata['title'],
-            Keywords=format_keywords(hitdata['keywords']),
-            Description=hitdata['description'],
-            Question=q,
-            RequesterAnnotation='',  # FIXME: get annotation if exists
-            QualificationRequirements=qualifications
+            Question=question,
+            RequesterAnnotation=''  # FIXME: get annotation if exists
         )
-        created_hits.append(hit.get('HIT', {}))
+        return hit.get('HIT', {})
     except ClientError as e:
         print(e)
+        return {}
+
+
+# results come back in question order no matter how many threads created them
+created_hits = [h for h in run_concurrently(create_hit, questions, args.concurrency) if h]
 
 pprint(created_hits)
 
@@ -0,0 +1,61 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Page through MTurk list_* calls with the largest page size and no wasted requests."""
+
+import time
+from typing import Callable, Iterator, List, Optional
+
+from concurrency import call_with_backoff
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+MAX_PAGE_SIZE = 100  # the most any MTurk list_* operation will return at once
+
+
+def paginate(method: Callable, key: str, timings: Optional[List[float]]=None, page_size: int=MAX_PAGE_SIZE,
+             **kwargs) -> Iterator[List[dict]]:
+    """
+    Yield the `key` items of each page returned by an MTurk list_* method.
+
+    Paging stops when a response has no NextToken or no items. MTurk can hand back a NextToken along with
+    an empty page, and following it would only cost more requests, or never end. If `timings` is given,
+    the number of seconds each request took is appended to it.
+    """
+    while True:
+        start = time.perf_counter()
+        response = call_with_backoff(method, MaxResults=page_size, **kwargs)
+        if timings is not None:
+            timings.append(time.perf_counter() - start)
+        items = response.get(key, [])
+        if items:
+            yield items
+        if not items or not response.get('NextToken'):
+            return
+        kwargs['NextToken'] = response['NextToken']
+
+
+def timing_summary(timings: List[float]) -> str:
+    """Describe how many pages were requested and how long they took."""
+    if not timings:
+        return 'No pages requested'
+    total = sum(timings)
+    return (f'{len(timings)} pages in {total:.2f} seconds '
+            f'({total / len(timings) * 1000:.0f} ms mean, {max(timings) * 1000:.0f} ms max per page)')
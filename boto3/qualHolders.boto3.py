@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Show who holds Mechanical Turk qualifications from a local cache, e.g. to audit exclusion lists."""
+
+import argparse
+import sys
+from csv import DictReader, writer
+
+import boto3
+
+from qualifications import DEFAULT_CACHE_DIR, REFRESH_MODES, get_holders, holds
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+parser = argparse.ArgumentParser(description='List or check the workers holding Amazon Mechanical Turk qualifications')
+parser.add_argument('-q', '--qualification', required=True, nargs='+', help='Qualification ID(s)')
+parser.add_argument('-w', '--workersfile',
+                    help='Tab delimited file with a workerid column (e.g. a results file) to check against the '
+                         'qualifications. Without one, every holder is listed.')
+parser.add_argument('-s', '--sandbox', action='store_true',
+                    help='Run the command in the Mechanical Turk Sandbox (used for testing purposes)')
+parser.add_argument('-p', '--profile',
+        help='Run commands using specific aws credentials rather the default. To set-up alternative credentials see http://boto3.readthedocs.org/en/latest/guide/configuration.html#shared-credentials-file')
+parser.add_argument('--refresh', choices=REFRESH_MODES, default='none',
+                    help='How to bring the cached lists of holders up to date first: not at all (offline), by '
+                         'fetching only recent grants, or by fetching every holder (default: none)')
+parser.add_argument('--cachedir', default=DEFAULT_CACHE_DIR,
+                    help='Directory for cached lists of qualification holders (default: ~/.mturkutils/qualifications)')
+args = parser.parse_args()
+
+mtc = None
+if args.refresh != 'none':
+    # Only region w/ MTurk endpoint currently is us-east-1
+    region = 'us-east-1'
+    endpoint = f'https://mturk-requester-sandbox.{region}.amazonaws.com' if args.sandbox else f'https://mturk-requester.{region}.amazonaws.com'
+    # If you want to use profiles, you have to create a Session with one before connecting a client
+    session = boto3.Session(profile_name=args.profile)
+    mtc = session.client('mturk', endpoint_url=endpoint, region_name=region)
+
+caches = [get_holders(mtc, q, args.refresh, args.cachedir) for q in args.qualification]
+for cache in caches:
+    print(f'{cache["qualificationtypeid"]}: {len(cache["workers"])} holders as of {cache["fetched"]}',
+          file=sys.stderr)
+
+out = writer(sys.stdout, delimiter='\t')
+if args.workersfile:
+    with open(args.workersfile, 'r') as infile:
+        workers = list(dict.fromkeys(row['workerid'] for row in DictReader(infile, delimiter='\t')))
+    out.writerow(['workerid'] + args.qualification)
+    for w in workers:
+        out.writerow([w] + [int(holds(cache, w)) for cache in caches])
+else:
+    out.writerow(['qualificationtypeid', 'workerid', 'value', 'granttime'])
+    for cache in caches:
+        for w, entry in sorted(cache['workers'].items()):
+            out.writerow([cache['qualificationtypeid'], w, entry['value'], entry['granttime']])
@@ -0,0 +1,149 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Keep a local copy of which workers hold a qualification so we don't have to ask MTurk every time.
+
+Each QualificationTypeId gets its own JSON file mapping WorkerId to the IntegerValue and GrantTime of
+their qualification, which is loaded into a dict for constant time lookups. The cache can be refreshed:
+  a) fully, by paging through every holder; this also drops workers whose qualification was revoked
+  b) incrementally, by paging only until we reach grants older than the last refresh
+Workers we grant the qualification to ourselves can be added with add_holder without any refresh.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from pagination import paginate
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.mturkutils', 'qualifications')
+
+REFRESH_MODES = ('none', 'incremental', 'full')
+
+# allow for grants whose GrantTime was a little before we last fetched but that hadn't shown up yet
+CLOCK_SKEW = timedelta(minutes=5)
+
+
+def cache_filename(qualid: str, cachedir: str=DEFAULT_CACHE_DIR) -> str:
+    return os.path.join(cachedir, f'{qualid}.json')
+
+
+def holder_entry(qual: dict) -> Dict:
+    """The part of a boto3 Qualification dict we keep for each worker."""
+    granttime = qual.get('GrantTime')
+    return {'value': qual.get('IntegerValue'), 'granttime': granttime.isoformat() if granttime else None}
+
+
+def load_cache(qualid: str, cachedir: str=DEFAULT_CACHE_DIR) -> Optional[Dict]:
+    """Read the cached holders of a qualification, or None if it has never been fetched."""
+    filename = cache_filename(qualid, cachedir)
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r') as cachefile:
+        return json.load(cachefile)
+
+
+def save_cache(cache: Dict, cachedir: str=DEFAULT_CACHE_DIR):
+    """
+    Write a qualification's cached holders, replacing the old file only once the new one is complete.
+
+    A placeholder that was never fetched from MTurk isn't written, since it would pass for a complete list.
+    """
+    if not cache.get('fetched'):
+        return
+    os.makedirs(cachedir, exist_ok=True)
+    filename = cache_filename(cache['qualificationtypeid'], cachedir)
+    with open(filename + '.tmp', 'w') as cachefile:
+        json.dump(cache, cachefile)
+    os.replace(filename + '.tmp', filename)
+
+
+def full_refresh(mtc, qualid: str) -> Dict:
+    """Build a cache from every worker currently granted a qualification."""
+    fetched = datetime.now(timezone.utc)
+    workers = {}
+    for page in paginate(mtc.list_workers_with_qualification_type, 'Qualifications',
+                         QualificationTypeId=qualid, Status='Granted'):
+        workers.update({q['WorkerId']: holder_entry(q) for q in page})
+    return {'qualificationtypeid': qualid, 'fetched': fetched.isoformat(), 'workers': workers}
+
+
+def incremental_refresh(mtc, cache: Dict) -> int:
+    """
+    Add grants made since the cache was last refreshed, returning how many workers were added or changed.
+
+    As long as the grants come back most recent first, paging stops at the first page that reaches back
+    past the last refresh. If the order we actually see disagrees, every page is read. Revocations aren't
+    noticed; use a full refresh for those.
+    """
+    since = datetime.fromisoformat(cache['fetched']) - CLOCK_SKEW
+    fetched = datetime.now(timezone.utc)
+    changed = 0
+    newest_first = True
+    last_granted = None
+    for page in paginate(mtc.list_workers_with_qualification_type, 'Qualifications',
+                         QualificationTypeId=cache['qualificationtypeid'], Status='Granted'):
+        for q in page:
+            entry = holder_entry(q)
+            if cache['workers'].get(q['WorkerId']) != entry:
+                cache['workers'][q['WorkerId']] = entry
+                changed += 1
+            if last_granted and q['GrantTime'] > last_granted:
+                newest_first = False
+            last_granted = q['GrantTime']
+        if newest_first and last_granted and last_granted < since:
+            break
+    cache['fetched'] = fetched.isoformat()
+    return changed
+
+
+def get_holders(mtc, qualid: str, refresh: str='incremental', cachedir: str=DEFAULT_CACHE_DIR) -> Dict:
+    """
+    Load the cache for a qualification, refreshing it as asked and saving the result.
+
+    A qualification that has never been cached is always fully fetched, unless `refresh` is 'none', in
+    which case an empty placeholder is returned that save_cache won't write.
+    """
+    cache = load_cache(qualid, cachedir)
+    if refresh == 'none':
+        return cache or {'qualificationtypeid': qualid, 'fetched': None, 'workers': {}}
+    if cache is None or refresh == 'full':
+        print(f'Fetching every worker holding {qualid}')
+        cache = full_refresh(mtc, qualid)
+    else:
+        print(f'Fetching workers granted {qualid} since {cache["fetched"]}')
+        incremental_refresh(mtc, cache)
+    save_cache(cache, cachedir)
+    return cache
+
+
+def holds(cache: Dict, workerid: str, value: int=None) -> bool:
+    """Whether a worker holds the qualification, with a particular value if one is given."""
+    entry = cache['workers'].get(workerid)
+    return entry is not None and (value is None or entry['value'] == value)
+
+
+def add_holder(cache: Dict, workerid: str, value: int):
+    """Record a grant we made ourselves."""
+    cache['workers'][workerid] = {'value': value, 'granttime': datetime.now(timezone.utc).isoformat()}
@@ -0,0 +1,105 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Turn boto3 HIT and Assignment dicts into rows for a results file."""
+
+from typing import Dict, Set, Tuple
+
+from answers import parse_answers
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+OPTIONAL_ASSIGNMENT_KEYS = {
+    'AcceptTime': 'assignmentaccepttime', 'RejectTime': 'assignmentrejecttime', 'Deadline': 'deadline',
+    'RequesterFeedback': 'feedback', 'ApprovalTime': 'assignmentapprovaltime'
+}
+
+
+def manage_url(hitid: str, sandbox: bool=False) -> str:
+    mturk_website = 'requestersandbox.mturk.com' if sandbox else 'requester.mturk.com'
+    return 'https://{}/mturk/manageHIT?HITId={}'.format(
+        mturk_website, hitid)
+
+
+def hit_row(hitinfo: dict, sandbox: bool=False) -> Tuple[Dict[str, str], Set]:
+    """
+    Build the part of a results row that is the same for every assignment of a HIT.
+
+    Returns the partial row and the set of extra (qualification) keys it adds. Compute this once per HIT
+    and hand it to process_assignment for each of the HIT's assignments.
+    """
+    row: Dict[str, str] = {
+        'hitid': hitinfo['HITId'],
+        'viewhit': manage_url(hitinfo['HITId'], sandbox),
+        # these assignment keys are optional
+        'assignmentaccepttime': '',
+        'assignmentapprovaltime': '',
+        'assignmentrejecttime': '',
+        'deadline': '',
+        'feedback': '',
+        # 'reject' is for processing results files to mark which rows are to be rejected with an x
+        'reject': '',
+        # HIT keys.
+        'hittypeid': hitinfo['HITTypeId'],
+        'hitgroupid': hitinfo['HITGroupId'],
+        'title': hitinfo['Title'],
+        'description': hitinfo['Description'],
+        'keywords': hitinfo['Keywords'],
+        'reward': '$' + hitinfo['Reward'],
+        'creationtime': hitinfo['CreationTime'],
+        'assignments': hitinfo['MaxAssignments'],
+        'numavailable': hitinfo['NumberOfAssignmentsAvailable'],
+        'numpending': hitinfo['NumberOfAssignmentsPending'],
+        'numcomplete': hitinfo['NumberOfAssignmentsCompleted'],
+        'hitstatus': hitinfo['HITStatus'],
+        'reviewstatus': hitinfo['HITReviewStatus'],
+        'assignmentduration': hitinfo['AssignmentDurationInSeconds'],
+        'autoapprovaldelay': hitinfo['AutoApprovalDelayInSeconds'],
+        'hitlifetime': hitinfo['Expiration'],
+        'annotation': hitinfo.get('RequesterAnnotation', '')
+    }
+
+    hit_keys = set()
+    for i, qual in enumerate(['|'.join(['{}:{}'.format(k, v) for k, v in x.items()]) for x in hitinfo.get('QualificationRequirements', [])]):
+        qualkey = 'Qualification.{}'.format(i)
+        row[qualkey] = qual
+        hit_keys.add(qualkey)
+    return row, hit_keys
+
+
+def process_assignment(assignment: dict, hit_template: Tuple[Dict[str, str], Set]) -> Tuple[Dict[str, str], Set]:
+    """Turn an Assignment dict as returned by boto3 into a row for results file, given its HIT's hit_row."""
+    hit_fields, hit_keys = hit_template
+    row = hit_fields.copy()
+    row['assignmentid'] = assignment['AssignmentId']
+    row['assignmentstatus'] = assignment['AssignmentStatus']
+    row['autoapprovaltime'] = assignment['AutoApprovalTime']
+    row['assignmentsubmittime'] = assignment['SubmitTime']
+    row['workerid'] = assignment['WorkerId']
+
+    # populate the optional keys if they exist
+    for k, v in OPTIONAL_ASSIGNMENT_KEYS.items():
+        if k in assignment:
+            row[v] = assignment[k]
+
+    # answers are in assignment['Answer'] as an MTurk QuestionFormAnswers XML string
+    user_answers = {f'Answer.{qid}': answer for qid, answer in parse_answers(assignment.get('Answer'))}
+    row.update(user_answers)
+    return row, hit_keys.union(user_answers)
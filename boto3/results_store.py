@@ -0,0 +1,87 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""SQLite store of results rows so getResults only has to re-fetch HITs that changed."""
+
+import json
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+# If none of these change, no assignment for the HIT has been accepted, submitted, returned or reviewed
+STATE_KEYS = ('HITStatus', 'HITReviewStatus', 'NumberOfAssignmentsAvailable',
+              'NumberOfAssignmentsPending', 'NumberOfAssignmentsCompleted')
+
+
+def open_store(filename: str) -> sqlite3.Connection:
+    """Open (and create if needed) a results store."""
+    conn = sqlite3.connect(filename)
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS hits (
+            hitid TEXT PRIMARY KEY,
+            state TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS assignments (
+            assignmentid TEXT PRIMARY KEY,
+            hitid TEXT NOT NULL,
+            row TEXT NOT NULL,
+            keys TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS assignments_hitid ON assignments (hitid);
+    ''')
+    return conn
+
+
+def hit_state(hitinfo: dict) -> str:
+    """Summarize the parts of a HIT that change whenever its assignments do."""
+    return json.dumps({k: hitinfo.get(k) for k in STATE_KEYS}, sort_keys=True)
+
+
+def stored_state(conn: sqlite3.Connection, hitid: str) -> Optional[str]:
+    """The HIT state as of the last time its assignments were stored, or None if never seen."""
+    found = conn.execute('SELECT state FROM hits WHERE hitid = ?', (hitid,)).fetchone()
+    return found[0] if found else None
+
+
+def save_hit(conn: sqlite3.Connection, hitid: str, state: str, rows: Iterable[Tuple[Dict, Set]]):
+    """Replace every stored row for a HIT along with its state, in a single transaction."""
+    with conn:
+        conn.execute('DELETE FROM assignments WHERE hitid = ?', (hitid,))
+        conn.executemany('INSERT OR REPLACE INTO assignments (assignmentid, hitid, row, keys) VALUES (?, ?, ?, ?)',
+                         ((row['assignmentid'], hitid, json.dumps(row, default=str), json.dumps(sorted(keys)))
+                          for row, keys in rows))
+        conn.execute('INSERT OR REPLACE INTO hits (hitid, state) VALUES (?, ?)', (hitid, state))
+
+
+def stored_keys(conn: sqlite3.Connection, hitids: List[str]) -> Set[str]:
+    """Union of the answer and qualification keys of every stored row for the given HITs."""
+    keys = set()
+    for hitid in hitids:
+        for (rowkeys,) in conn.execute('SELECT keys FROM assignments WHERE hitid = ?', (hitid,)):
+            keys.update(json.loads(rowkeys))
+    return keys
+
+
+def stored_rows(conn: sqlite3.Connection, hitids: List[str]) -> Iterator[Dict]:
+    """Yield stored rows HIT by HIT, in the order given and then the order they were stored."""
+    for hitid in hitids:
+        for (row,) in conn.execute('SELECT row FROM assignments WHERE hitid = ? ORDER BY rowid', (hitid,)):
+            yield json.loads(row)
@@ -26,92 +26,103 @@ Mechanical Turk experiment. To make it more flexible, it reads some
 variables in from the file 'bonus.cfg'
 n.b. This probably won't work in Python < 2.7
 
+Bonuses can be tiered on each worker's total across several experiments by
+listing more than one results file, either separated by whitespace in the
+'result_file' option or on the command line with -r.
+
 Fixed version of calculate_bonus
 """
 
 from __future__ import print_function, division
 
-from itertools import tee
+import argparse
+import os
+from glob import glob
 
-import unicodecsv as csv
-from six.moves import configparser, zip
+from six.moves import configparser
 
 __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 
 
-def pairwise(iterable):
-    """s -> (s0,s1), (s1,s2), (s2, s3), ..."""
-    a, b = tee(iterable)
-    next(b, None)
-    return zip(a, b)
-
-cfg = configparser.ConfigParser()
-cfg.read('bonus.cfg')
-
-resultfile = cfg.get('Files', 'result_file')
-expt_name = cfg.get('Experiment', 'name')
-
-trialamt = cfg.getfloat('Trial', 'trialamt')
-# amazon takes 10% on top per HIT, minimum of $0.005
-amzcut = trialamt * 0.10
-if amzcut < 0.005:
-    amzcut = 0.005
-
-i = 1
-bonus_steps = []
-while cfg.has_option('Bonus', "trials%d" % i):
-    bonus_steps.append(dict((
-        ('count', cfg.getint('Bonus', "trials%d" % i)),
-        ('amount', cfg.getfloat('Bonus', "bonus%d" % i))
-        )))
-    i += 1
-bonus_steps = sorted(bonus_steps, key=lambda k: k['count'])
-
-with open(resultfile, 'r') as csvfile:
-    results = list(csv.DictReader(csvfile, delimiter='\t', encoding='utf-8'))
-
-results_list = [(row['workerid'], row['assignmentid']) for row in results]
-workers = set([row['workerid'] for row in results])
-
-workers_by_count = []
-for w in workers:
-    matching_rows = [x for x in results_list if x[0] == w]
-    workers_by_count.append(dict((('workerid', w), ('count', len(matching_rows)), ('assignmentid', matching_rows[0][1]))))
-workers_by_count = sorted(workers_by_count, key=lambda k: k['count'])
-
-step_indices = [s['count'] for s in bonus_steps]
-step_indices.append(float("inf"))  # to catch from largest index up
-bonus_workers = [w for w in workers_by_count if w['count'] >= step_indices[0]]
-bonus_blocks = []
-for x, y in pairwise(step_indices):
-    bonus_blocks.append([w for w in bonus_workers if x <= w['count'] < y])
-
-bonuscost = 0.0
-for i, step in enumerate(bonus_steps):
-    bonuscost += len(bonus_blocks[i]) * step['amount']
-
-trialcost = (len(results) * trialamt)
-amzcost = (len(results) * amzcut)
-amzbonus = bonuscost * 0.10
-percentworkers = (len(bonus_workers) / len(workers)) * 100
-print("{0} workers did a total of {1} trials".format(len(workers), len(results)))
-print("{0} workers ({1:.2f}%) earned bonuses".format(len(bonus_workers), percentworkers))
-print("${0:.2f} total trial cost".format(trialcost))
-print("${0:.2f} total amazon cut".format(amzcost))
-print("${0:.2f} total bonus cost".format(bonuscost))
-print("${0:.2f} total amazon bonus cut".format(amzbonus))
-print("${0:.2f} total cost".format(trialcost + bonuscost + amzcost + amzbonus))
-
-
-with open('bonus.' + expt_name + '.csv', 'w') as csvoutfile:
-    fields = ('worker', 'trials', 'bonus', 'assignment')
-    bonuswriter = csv.DictWriter(csvoutfile, fieldnames=fields, encoding='utf-8')
-    bonuswriter.writeheader()
+def main():
+    parser = argparse.ArgumentParser(description='Calculate bonus payments for one or more experiments')
+    parser.add_argument('-c', '--config', default='bonus.cfg', help='Bonus configuration file (default: bonus.cfg)')
+    parser.add_argument('-r', '--resultsfiles', nargs='+',
+                        help="Results files to total trials across, instead of the config's result_file")
+    parser.add_argument('--nocache', action='store_true',
+                        help='Re-read every results file instead of reusing trial counts cached by file hash')
+    parser.add_argument('-n', '--processes', type=int,
+                        help='Number of results files to read at once (default: one per CPU)')
+    args = parser.parse_args()
+
+    # bonus_tiers reads the results with pandas, which is slow to import, so --help doesn't wait for it
+    import unicodecsv as csv
+    from bonus_tiers import DEFAULT_CACHE_DIR, count_files, tier_workers
+
+    cfg = configparser.ConfigParser()
+    cfg.read(args.config)
+
+    resultfiles = args.resultsfiles or cfg.get('Files', 'result_file').split()
+    # allow wildcards, e.g. result_file = results/*.tsv
+    resultfiles = [f for pattern in resultfiles for f in (sorted(glob(pattern)) or [pattern])]
+    # the same file listed twice, or matched by overlapping wildcards, would count every trial twice
+    seen = set()
+    resultfiles = [f for f in resultfiles
+                   if not (os.path.realpath(f) in seen or seen.add(os.path.realpath(f)))]
+    expt_name = cfg.get('Experiment', 'name')
+
+    trialamt = cfg.getfloat('Trial', 'trialamt')
+    # amazon takes 10% on top per HIT, minimum of $0.005
+    amzcut = trialamt * 0.10
+    if amzcut < 0.005:
+        amzcut = 0.005
+
+    i = 1
+    bonus_steps = []
+    while cfg.has_option('Bonus', "trials%d" % i):
+        bonus_steps.append(dict((
+            ('count', cfg.getint('Bonus', "trials%d" % i)),
+            ('amount', cfg.getfloat('Bonus', "bonus%d" % i))
+            )))
+        i += 1
+    bonus_steps = sorted(bonus_steps, key=lambda k: k['count'])
+
+    counts, first_assignment = count_files(resultfiles, None if args.nocache else DEFAULT_CACHE_DIR, args.processes)
+    num_trials = sum(counts.values())
+    workers = set(counts)
+
+    bonus_blocks = tier_workers(counts, first_assignment, bonus_steps)
+    bonus_workers = [w for block in bonus_blocks for w in block]
+
+    bonuscost = 0.0
     for i, step in enumerate(bonus_steps):
-        for row in [j for j in bonus_blocks[i]]:
-            bonuswriter.writerow({
-                'worker': row['workerid'],
-                'trials': row['count'],
-                'bonus': step['amount'],
-                'assignment': row['assignmentid']
-            })
+        bonuscost += len(bonus_blocks[i]) * step['amount']
+
+    trialcost = (num_trials * trialamt)
+    amzcost = (num_trials * amzcut)
+    amzbonus = bonuscost * 0.10
+    percentworkers = (len(bonus_workers) / len(workers)) * 100
+    print("{0} workers did a total of {1} trials".format(len(workers), num_trials))
+    print("{0} workers ({1:.2f}%) earned bonuses".format(len(bonus_workers), percentworkers))
+    print("${0:.2f} total trial cost".format(trialcost))
+    print("${0:.2f} total amazon cut".format(amzcost))
+    print("${0:.2f} total bonus cost".format(bonuscost))
+    print("${0:.2f} total amazon bonus cut".format(amzbonus))
+    print("${0:.2f} total cost".format(trialcost + bonuscost + amzcost + amzbonus))
+
+    with open('bonus.' + expt_name + '.csv', 'wb') as csvoutfile:
+        fields = ('worker', 'trials', 'bonus', 'assignment')
+        bonuswriter = csv.DictWriter(csvoutfile, fieldnames=fields, encoding='utf-8')
+        bonuswriter.writeheader()
+        for i, step in enumerate(bonus_steps):
+            for row in [j for j in bonus_blocks[i]]:
+                bonuswriter.writerow({
+                    'worker': row['workerid'],
+                    'trials': row['count'],
+                    'bonus': step['amount'],
+                    'assignment': row['assignmentid']
+                })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Summarize how long workers took on a HIT without holding every duration in memory.
+
+Used by time_pay_stats.py. DurationHistogram keeps a fixed number of log-spaced bins, so the median and
+percentiles of any number of results files can be estimated a chunk at a time. binned_kde estimates the
+density of submit times on a fixed grid with an FFT instead of evaluating a kernel at every duration.
+assignment_times and pay_rates turn results rows into durations and hourly pay.
+"""
+
+from __future__ import division
+
+from math import ceil, floor, log
+
+import numpy as np
+import pandas as pd
+
+from results_loader import iter_file_chunks, parse_times
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+HOUR = 3600
+WEEK = 7 * 24 * 3600
+
+RESULTS_COLUMNS = ['assignmentstatus', 'assignmentaccepttime', 'assignmentsubmittime']
+TIME_COLUMNS = ['assignmentaccepttime', 'assignmentsubmittime']
+
+
+class DurationHistogram(object):
+    """
+    Fixed-memory histogram of durations in seconds.
+
+    Bin edges grow geometrically, so any quantile read from it is within relative_error of a duration
+    that was actually added, as long as it lies between min_seconds and max_seconds (shorter and longer
+    durations are counted in the end bins). The count, mean, standard deviation, minimum and maximum
+    are exact.
+    """
+
+    def __init__(self, min_seconds=0.1, max_seconds=WEEK, relative_error=0.005):
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self.offset = int(floor(log(min_seconds, self.gamma)))
+        self.counts = np.zeros(int(ceil(log(max_seconds, self.gamma))) - self.offset + 1, dtype=np.int64)
+        self.n = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, durations):
+        """Count an array of durations."""
+        durations = np.asarray(durations, dtype=float)
+        if not len(durations):
+            return
+        # bin i holds durations in (gamma ** (i - 1), gamma ** i]
+        bins = np.ceil(np.log(np.clip(durations, self.min_seconds, self.max_seconds)) / np.log(self.gamma))
+        bins = np.clip(bins.astype(np.int64) - self.offset, 0, len(self.counts) - 1)
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        self.n += len(durations)
+        self.total += durations.sum()
+        self.total_squares += np.square(durations).sum()
+        self.min = min(self.min, durations.min())
+        self.max = max(self.max, durations.max())
+
+    def mean(self):
+        return self.total / self.n
+
+    def std(self):
+        """Population standard deviation, the same as np.std."""
+        return np.sqrt(max(self.total_squares / self.n - self.mean() ** 2, 0.0))
+
+    def bin_values(self):
+        """A representative duration for every bin: the one with the least relative error to either edge."""
+        upper = self.gamma ** (np.arange(len(self.counts)) + self.offset)
+        return np.clip(2 * upper / (self.gamma + 1), self.min, self.max)
+
+    def quantile(self, q):
+        """Estimate the q'th quantile (0 <= q <= 1), as np.percentile(durations, 100 * q) would give."""
+        rank = q * (self.n - 1)
+        return self.bin_values()[np.searchsorted(np.cumsum(self.counts), rank, side='right')]
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+def binned_kde(durations, weights=None, gridsize=1024, bandwidth_factor=0.25):
+    """
+    Gaussian kernel density estimate of durations on an evenly spaced grid from 0 to the longest duration.
+
+    Durations are spread linearly between their two nearest grid points and then smoothed with one FFT
+    convolution, which costs O(n + gridsize log gridsize) rather than O(n * gridsize). Weights count
+    each duration more than once, e.g. the bin counts of a DurationHistogram. The bandwidth is
+    bandwidth_factor times the standard deviation, as with gaussian_kde's covariance_factor.
+
+    Returns the grid and the density at each point on it.
+    """
+    durations = np.asarray(durations, dtype=float)
+    weights = np.ones_like(durations) if weights is None else np.asarray(weights, dtype=float)
+    xs = np.linspace(0.0, max(durations.max(), 1.0), gridsize)
+    step = xs[1] - xs[0]
+
+    position = np.clip(durations / step, 0, gridsize - 1)
+    left = np.minimum(np.floor(position).astype(np.int64), gridsize - 2)
+    right_share = position - left
+    grid = np.bincount(left, weights * (1 - right_share), minlength=gridsize)
+    grid += np.bincount(left + 1, weights * right_share, minlength=gridsize)
+
+    mean = np.average(durations, weights=weights)
+    bandwidth = bandwidth_factor * np.sqrt(np.average((durations - mean) ** 2, weights=weights)) or step
+    # kernel out to 4 bandwidths either side, capped so the convolution never wraps around
+    reach = min(int(ceil(4 * bandwidth / step)), gridsize - 1)
+    offsets = np.arange(-reach, reach + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+
+    size = gridsize + 2 * reach
+    density = np.fft.irfft(np.fft.rfft(grid, size) * np.fft.rfft(kernel, size), size)[reach:reach + gridsize]
+    return xs, np.maximum(density, 0) / weights.sum()
+
+
+def outlier_mask(arr):
+    """
+    Given an array, return a boolean array that is False for outliers, where outliers are those values
+    greater than two standard deviations from the mean
+    """
+    nparr = arr if isinstance(arr, np.ndarray) else np.array(arr)
+    twosigup = nparr.mean() + nparr.std() * 2
+    twosigdown = nparr.mean() - nparr.std() * 2
+
+    return (nparr < twosigup) & (nparr > twosigdown)
+
+
+def parse_rewards(rewards):
+    """
+    Turn a column of rewards like '$0.50' into an array of numbers, with NaN where one is missing.
+
+    There are only ever a few distinct rewards, so each is parsed once and mapped through the category
+    codes.
+    """
+    rewards = rewards.astype('category')
+    parsed = pd.to_numeric(rewards.cat.categories.str.lstrip('$')).values.astype(float)
+    # code -1 (missing) picks the NaN on the end
+    return np.append(parsed, np.nan)[rewards.cat.codes.values]
+
+
+def assignment_times(results, columns=()):
+    """
+    Turn results rows into a DataFrame of how many seconds each assignment took, along with any other
+    columns asked for. The times can be strings or already parsed datetimes. 'reward' is turned from
+    e.g. '$0.50' into a number with parse_rewards, so it's quickest loaded as a categorical.
+    """
+    frame = pd.DataFrame({'seconds': (parse_times(results['assignmentsubmittime']) -
+                                      parse_times(results['assignmentaccepttime'])).dt.total_seconds().values})
+    for c in columns:
+        if c == 'reward':
+            frame[c] = parse_rewards(results[c])
+        else:
+            frame[c] = results[c].values
+    return frame
+
+
+def stream_results(resultsfiles, removerejected, columns=(), chunksize=10000):
+    """
+    Yield assignment_times for chunksize rows at a time, along with how many rows were read before
+    dropping rejected work. The 'batch' column is the results file the rows came from.
+    """
+    for r in resultsfiles:
+        for chunk in iter_file_chunks(r, RESULTS_COLUMNS + [c for c in columns if c != 'batch'], chunksize):
+            rows = len(chunk)
+            if removerejected:
+                chunk = chunk[chunk['assignmentstatus'] != 'Rejected']
+            yield rows, assignment_times(chunk.assign(batch=r), columns)
+
+
+def pay_rates(results, by, minwage=None):
+    """
+    Time taken and hourly pay for every group of assignments at once.
+
+    Hourly pay is worked out from seconds per dollar, so with a single reward it's the same as
+    HOUR / time * reward. If minwage is given, 'underpaid' is the share of each group's assignments
+    paid less than that per hour.
+    """
+    results = results.assign(perdollar=results['seconds'] / results['reward'])
+    if minwage:
+        results['underpaid'] = results['perdollar'] > HOUR / minwage
+    grouped = results.groupby(by, sort=True, observed=True)
+    stats = grouped['seconds'].agg(['count', 'min', 'median', 'mean', 'max'])
+    perdollar = grouped['perdollar'].agg(['min', 'median', 'max'])
+    totals = grouped[['seconds', 'reward']].sum()
+    stats['minpay'] = HOUR / perdollar['max']
+    stats['meanpay'] = HOUR * totals['reward'] / totals['seconds']
+    stats['medianpay'] = HOUR / perdollar['median']
+    stats['maxpay'] = HOUR / perdollar['min']
+    if minwage:
+        stats['underpaid'] = grouped['underpaid'].mean()
+    return stats
@@ -0,0 +1,407 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Load the tab delimited results files getResults writes, for the scripts that analyze them.
+
+Used by time_pay_stats.py, calculateBonus.py (through bonus_tiers.py) and approveWork.boto3.py. Only the
+columns a script asks for are parsed, every value is kept as a string unless it's asked for as a time, and
+several files are read at once in separate processes. Parquet and Feather files written by getResults
+--format are read memory mapped, and need pyarrow.
+
+Parsed columns can be cached in a sidecar directory for each results file, under ~/.mturkutils/results by
+default, so later runs memory map them instead of parsing the text again. Times are stored as int64 epoch
+nanoseconds and strings as category codes (see save_column). The sidecar is valid for as long as the
+file's size and modification time are unchanged, or, if those change, its SHA-1 still matches; otherwise
+it is rebuilt. Caching is off unless a cachedir is given.
+"""
+
+from __future__ import division
+
+import errno
+import hashlib
+import json
+import os
+import re
+from functools import partial
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+import pandas as pd
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+SIDECAR_VERSION = 2
+
+# getResults.boto3.py writes times as a fixed width local time followed by its UTC offset,
+# e.g. 2017-05-01 12:34:56-04:00
+LOCAL_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+LOCAL_TIME_WIDTH = 19
+UTC_OFFSET = re.compile(r'^([+-])(\d\d):?(\d\d)$')
+
+
+def utc_offsets(suffixes):
+    """
+    Seconds east of UTC for each of a Series of offsets like '-04:00', or None if any of them isn't one.
+
+    Each distinct offset is only parsed once.
+    """
+    codes, uniques = pd.factorize(suffixes)
+    if (codes < 0).any():
+        return None
+    seconds = []
+    for offset in uniques:
+        match = UTC_OFFSET.match(offset)
+        if not match:
+            return None
+        sign, hours, minutes = match.groups()
+        seconds.append((-1 if sign == '-' else 1) * (int(hours) * 3600 + int(minutes) * 60))
+    return np.asarray(seconds, dtype=np.int64)[codes]
+
+
+def parse_times(values):
+    """
+    Parse a column of timestamps into a pandas Series of UTC datetimes in one go.
+
+    Times in the format getResults writes are parsed as naive local times, which pandas does far faster
+    than with %z, and then shifted by their offsets. Anything else is left to pandas to work out, and only
+    falls back to parsing row by row with dateutil (e.g. files from the old Java command line tools).
+    Times that are already datetimes, e.g. loaded with times=, are only converted to UTC.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        values = pd.Series(values)
+        return values.dt.tz_convert('UTC') if values.dt.tz else values.dt.tz_localize('UTC')
+    values = pd.Series(values, dtype=object)
+    try:
+        local = pd.to_datetime(values.str.slice(0, LOCAL_TIME_WIDTH), format=LOCAL_TIME_FORMAT)
+        offsets = utc_offsets(values.str.slice(LOCAL_TIME_WIDTH))
+        if offsets is not None:
+            return (local - pd.to_timedelta(offsets, unit='s')).dt.tz_localize('UTC')
+    except (ValueError, TypeError, AttributeError):
+        pass
+    try:
+        return pd.to_datetime(values, utc=True)
+    except (ValueError, TypeError):
+        from dateutil.parser import parse
+        return pd.to_datetime(values.map(parse), utc=True)
+
+
+# starting worker processes costs more than reading this much text ourselves
+PARALLEL_MIN_BYTES = 32 << 20
+
+# os.replace is Python 3 only; os.rename does the same on POSIX
+replace = getattr(os, 'replace', os.rename)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.mturkutils', 'results')
+
+# getResults writes these with --format parquet or feather; they're typed and memory mapped as they are,
+# so they're never cached
+COLUMNAR_EXTENSIONS = ('.parquet', '.feather')
+
+
+def is_columnar(filename):
+    """Whether a results file is one of the typed Parquet or Feather files getResults writes with --format."""
+    return os.path.splitext(filename)[1].lower() in COLUMNAR_EXTENSIONS
+
+
+def columnar_header(filename):
+    """The column names of a Parquet or Feather file, from its schema alone."""
+    if filename.lower().endswith('.parquet'):
+        from pyarrow.parquet import read_schema
+        return read_schema(filename).names
+    from pyarrow import ipc, memory_map
+    with memory_map(filename) as source:
+        return ipc.open_file(source).schema.names
+
+
+def read_columnar_file(filename, wanted):
+    """Read the wanted columns of a Parquet or Feather results file, memory mapping it rather than copying it."""
+    usecols = [c for c in columnar_header(filename) if c in wanted]
+    if filename.lower().endswith('.parquet'):
+        return pd.read_parquet(filename, columns=usecols, memory_map=True)
+    return pd.read_feather(filename, columns=usecols)
+
+
+def as_strings(values, categorical=False):
+    """
+    A typed column of a Parquet or Feather file as the strings it would be in a text results file, e.g. the
+    Decimal 0.50 as '0.50'. Each distinct value is only converted once.
+    """
+    values = values.astype('category')
+    values = values.cat.rename_categories([str(v) for v in values.cat.categories])
+    return values if categorical else values.astype(object)
+
+
+def file_digest(filename, blocksize=1 << 20):
+    """SHA-1 of a file's contents, read a block at a time."""
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def sidecar_dir(filename, cachedir=DEFAULT_CACHE_DIR):
+    """The directory a results file's cached columns are kept in, named by a hash of its full path."""
+    return os.path.join(cachedir, hashlib.sha1(os.path.realpath(filename).encode('utf-8')).hexdigest())
+
+
+def load_manifest(filename, cachedir=DEFAULT_CACHE_DIR):
+    """The sidecar manifest for a results file if it has one and it's current, otherwise None."""
+    manifest_file = os.path.join(sidecar_dir(filename, cachedir), 'manifest.json')
+    try:
+        with open(manifest_file, 'r') as infile:
+            manifest = json.load(infile)
+    except (IOError, OSError, ValueError):
+        return None
+    stat = os.stat(filename)
+    if manifest.get('version') != SIDECAR_VERSION:
+        return None
+    if not all(k in manifest for k in ('size', 'mtime', 'sha1', 'header', 'columns')):
+        return None
+    if manifest['size'] == stat.st_size and manifest['mtime'] == stat.st_mtime:
+        return manifest
+    # touched or copied but not changed
+    if manifest['size'] == stat.st_size and manifest['sha1'] == file_digest(filename):
+        manifest['mtime'] = stat.st_mtime
+        save_manifest(filename, manifest, cachedir)
+        return manifest
+    return None
+
+
+def save_manifest(filename, manifest, cachedir=DEFAULT_CACHE_DIR):
+    """Write a sidecar manifest, replacing any other in one step so readers never see half of it."""
+    manifest_file = os.path.join(sidecar_dir(filename, cachedir), 'manifest.json')
+    with open(manifest_file + '.{}.tmp'.format(os.getpid()), 'w') as outfile:
+        json.dump(manifest, outfile)
+    replace(manifest_file + '.{}.tmp'.format(os.getpid()), manifest_file)
+
+
+def current_digest(filename, cachedir=DEFAULT_CACHE_DIR):
+    """SHA-1 of a results file, taken from its sidecar if that's current rather than reading the whole file."""
+    manifest = load_manifest(filename, cachedir)
+    return manifest['sha1'] if manifest else file_digest(filename)
+
+
+def save_array(directory, name, values):
+    """Save a NumPy array to <name>.npy in directory, replacing any other in one step."""
+    tmpfile = os.path.join(directory, '{}.{}.tmp.npy'.format(name, os.getpid()))
+    np.save(tmpfile, values)
+    replace(tmpfile, os.path.join(directory, name + '.npy'))
+
+
+def save_column(directory, name, values, kind):
+    """
+    Save one parsed column to a sidecar and return its manifest entry.
+
+    Times are stored as int64 nanoseconds since the epoch (UTC), which load back with no parsing at all.
+    Strings are stored as int32 category codes plus the distinct values, sorted as astype('category') sorts
+    them, in one NUL separated block of UTF-8. That's a fraction of the size of a fixed width NumPy string
+    array and is split in one call.
+    """
+    if kind == 'times':
+        nanoseconds = np.asarray(values.dt.tz_convert(None), dtype='datetime64[ns]').view(np.int64)
+        save_array(directory, name + '.times', nanoseconds)
+        return {'name': name, 'kind': kind}
+    codes, categories = pd.factorize(values, sort=True)
+    save_array(directory, name + '.codes', codes.astype(np.int32))
+    save_array(directory, name + '.categories',
+               np.frombuffer(u'\x00'.join(categories).encode('utf-8'), dtype=np.uint8))
+    return {'name': name, 'kind': kind, 'categories': len(categories)}
+
+
+def load_column(directory, entry, categorical):
+    """Load a column saved by save_column, as a pandas categorical if categorical, otherwise as strings."""
+    if entry['kind'] == 'times':
+        times = np.load(os.path.join(directory, entry['name'] + '.times.npy'), mmap_mode='r')
+        return pd.Series(times.view('datetime64[ns]')).dt.tz_localize('UTC')
+    codes = np.load(os.path.join(directory, entry['name'] + '.codes.npy'), mmap_mode='r')
+    block = np.load(os.path.join(directory, entry['name'] + '.categories.npy'))
+    categories = block.tobytes().decode('utf-8').split(u'\x00')[:entry['categories']]
+    if len(categories) != entry['categories']:
+        raise ValueError('column {} has {} categories, not {}'.format(entry['name'], len(categories),
+                                                                      entry['categories']))
+    values = pd.Categorical.from_codes(codes, categories)
+    return pd.Series(values if categorical else np.asarray(values, dtype=object))
+
+
+def read_cached_file(filename, columns, optional=(), categorical=(), times=(), cachedir=DEFAULT_CACHE_DIR):
+    """
+    Read the given columns of one results file as read_results_file does, going through its sidecar.
+
+    Columns already in the sidecar are memory mapped; any others are parsed from the file and added. If
+    the sidecar turns out to be truncated or corrupt, its manifest is removed so the next run rebuilds
+    it, and the error is raised.
+    """
+    directory = sidecar_dir(filename, cachedir)
+    manifest = load_manifest(filename, cachedir)
+    if manifest is None:
+        stat = os.stat(filename)
+        manifest = {'version': SIDECAR_VERSION, 'file': os.path.realpath(filename), 'size': stat.st_size,
+                    'mtime': stat.st_mtime, 'sha1': file_digest(filename),
+                    'header': list(pd.read_csv(filename, sep='\t', nrows=0).columns), 'columns': {}}
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    header = manifest['header']
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ValueError('{} has no {} column(s)'.format(filename, ', '.join(missing)))
+    wanted = [c for c in header if c in set(columns) | set(optional)]
+    kinds = dict((c, 'times' if c in times else 'strings') for c in wanted)
+
+    to_parse = [c for c in wanted if manifest['columns'].get(c, {}).get('kind') != kinds[c]]
+    if to_parse:
+        parsed = pd.read_csv(filename, sep='\t', dtype=str, usecols=to_parse)
+        for c in to_parse:
+            values = parse_times(parsed[c]) if kinds[c] == 'times' else parsed[c]
+            # files are named by position since column names can be anything
+            manifest['columns'][c] = save_column(directory, str(header.index(c)), values, kinds[c])
+        save_manifest(filename, manifest, cachedir)
+
+    try:
+        results = dict((c, load_column(directory, manifest['columns'][c], c in categorical)) for c in wanted)
+        if len(set(len(values) for values in results.values())) > 1:
+            raise ValueError('{} has cached columns of different lengths'.format(directory))
+        return pd.DataFrame(results, columns=wanted)
+    except (IOError, OSError, ValueError, EOFError):
+        try:
+            os.remove(os.path.join(directory, 'manifest.json'))
+        except OSError:
+            pass
+        raise
+
+
+def read_results_file(filename, columns, optional=(), categorical=(), times=(), cachedir=None):
+    """
+    Read the given columns of one results file into a DataFrame of strings.
+
+    Columns in optional are read if the file has them. Columns in categorical are stored as pandas
+    categories, which is far smaller for ones like workerid or assignmentstatus that repeat a lot. Columns
+    in times are parsed into UTC datetimes with parse_times. With a cachedir, the columns are read through
+    the file's sidecar in it (see read_cached_file). If the sidecar can't be written or read, the file is
+    read as if there were no cachedir.
+
+    Parquet and Feather files (see is_columnar) are read memory mapped, and their typed columns turned back
+    into strings with as_strings, except for times, which are already parsed.
+    """
+    wanted = set(columns) | set(optional)
+    if is_columnar(filename):
+        results = read_columnar_file(filename, wanted)
+        for c in results.columns:
+            if c not in times:
+                results[c] = as_strings(results[c], c in categorical)
+    else:
+        if cachedir:
+            try:
+                return read_cached_file(filename, columns, optional, categorical, times, cachedir)
+            except (IOError, OSError, ValueError, EOFError):
+                pass
+        results = pd.read_csv(filename, sep='\t', dtype=str, usecols=lambda c: c in wanted)
+    missing = [c for c in columns if c not in results.columns]
+    if missing:
+        raise ValueError('{} has no {} column(s)'.format(filename, ', '.join(missing)))
+    for c in categorical:
+        if c in results.columns:
+            results[c] = results[c].astype('category')
+    for c in times:
+        if c in results.columns:
+            results[c] = parse_times(results[c])
+    return results
+
+
+def iter_file_chunks(filename, columns, chunksize):
+    """
+    Yield the given columns of one results file chunksize rows at a time, as strings like read_results_file.
+
+    Parquet and Feather files are read a record batch at a time, with their times left parsed.
+    """
+    if not is_columnar(filename):
+        for chunk in pd.read_csv(filename, sep='\t', dtype=str, chunksize=chunksize, usecols=columns):
+            yield chunk
+        return
+    header = columnar_header(filename)
+    missing = [c for c in columns if c not in header]
+    if missing:
+        raise ValueError('{} has no {} column(s)'.format(filename, ', '.join(missing)))
+    if filename.lower().endswith('.parquet'):
+        from pyarrow.parquet import ParquetFile
+        batches = ParquetFile(filename, memory_map=True).iter_batches(batch_size=chunksize, columns=list(columns))
+    else:
+        from pyarrow.feather import read_table
+        batches = read_table(filename, columns=list(columns), memory_map=True).to_batches(max_chunksize=chunksize)
+    for batch in batches:
+        chunk = batch.to_pandas()
+        for c in chunk.columns:
+            if not pd.api.types.is_datetime64_any_dtype(chunk[c]):
+                chunk[c] = as_strings(chunk[c])
+        yield chunk
+
+
+def iter_results(filenames, columns, optional=(), categorical=(), times=(), processes=None, cachedir=None):
+    """
+    Yield (filename, DataFrame) for each results file, in the order given, as read_results_file reads them.
+
+    Files are read by up to `processes` worker processes at a time. By default that's one per CPU, once
+    there's more than PARALLEL_MIN_BYTES to read; less than that is read in this process, as is a single
+    file or processes=1. Scripts that read more than one file must only do so from under an
+    `if __name__ == '__main__':` guard, since on macOS and Windows each worker process imports the script.
+    """
+    read = partial(read_results_file, columns=columns, optional=optional, categorical=categorical, times=times,
+                   cachedir=cachedir)
+    if processes is None and sum(os.path.getsize(f) for f in filenames) < PARALLEL_MIN_BYTES:
+        processes = 1
+    processes = min(processes or cpu_count(), len(filenames))
+    if processes <= 1:
+        for filename in filenames:
+            yield filename, read(filename)
+        return
+
+    pool = Pool(processes)
+    try:
+        for filename, results in zip(filenames, pool.imap(read, filenames)):
+            yield filename, results
+    finally:
+        pool.close()
+        pool.join()
+
+
+def load_results(filenames, columns, optional=(), categorical=(), times=(), source=None, processes=None,
+                 cachedir=None):
+    """
+    Read the given columns of many results files into one DataFrame, as iter_results does.
+
+    If source is given, a column of that name records which file each row came from.
+    """
+    frames = [results for _, results in iter_results(filenames, columns, optional, categorical, times, processes,
+                                                     cachedir)]
+    if not frames:
+        return pd.DataFrame(columns=list(columns) + ([source] if source else []))
+    # concatenating categoricals keeps them categorical only if every file has the same categories
+    combined = pd.concat(frames, ignore_index=True)
+    for c in categorical:
+        if c in combined.columns and combined[c].dtype != 'category':
+            combined[c] = combined[c].astype('category')
+    if source:
+        combined[source] = pd.Categorical(np.repeat(filenames, [len(f) for f in frames]))
+    return combined
@@ -0,0 +1,71 @@
+# Copyright (c) 2012-2017 Andrew Watts and the University of Rochester BCS Department
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""time_pay_stats gives the same answers for a Parquet or Feather results file as for the text one."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, 'boto3'))
+
+from columnar import RESULTS_DATETIMES, RESULTS_DECIMALS, RESULTS_INTEGERS, typed_frame, write_frame  # noqa: E402
+
+__author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
+
+
+def results_rows(n=300):
+    """Results rows as getResults writes them to a text file."""
+    accept = pd.Timestamp('2017-05-01 09:00:00') + pd.to_timedelta([(i * 7919) % 86400 for i in range(n)], unit='s')
+    submit = accept + pd.to_timedelta([60 + (i * 104729) % 1800 for i in range(n)], unit='s')
+    return pd.DataFrame({
+        'hittypeid': ['3TYPE{}'.format(i % 3) for i in range(n)],
+        'assignmentid': ['3ASSIGNMENT{:05d}'.format(i) for i in range(n)],
+        'workerid': ['AWORKER{:03d}'.format(i % 40) for i in range(n)],
+        'assignmentstatus': [('Approved', 'Submitted', 'Rejected')[i % 7 % 3] for i in range(n)],
+        'assignmentaccepttime': accept.strftime('%Y-%m-%d %H:%M:%S') + '-04:00',
+        'assignmentsubmittime': submit.strftime('%Y-%m-%d %H:%M:%S') + '-04:00',
+        'reward': ['$0.50' if i % 2 else '$1.00' for i in range(n)],
+        'assignments': [str(1 + i % 9) for i in range(n)],
+    })
+
+
+def time_pay_stats(*args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, 'time_pay_stats.py')] + list(args),
+                          check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'feather'])
+@pytest.mark.parametrize('options', [['-g', 'hittypeid', 'workerid', '-w', '7.25', '-o', '-j'],
+                                     ['-s', '50', '-w', '7.25', '-o', '-j']])
+def test_time_pay_stats_reads_columnar_files(tmp_path, fmt, options):
+    rows = results_rows()
+    textfile = str(tmp_path / 'results.tsv')
+    rows.to_csv(textfile, sep='\t', index=False)
+    columnarfile = str(tmp_path / 'results.{}'.format(fmt))
+    write_frame(typed_frame(rows.copy(), RESULTS_DATETIMES, RESULTS_DECIMALS, RESULTS_INTEGERS), columnarfile, fmt)
+
+    assert time_pay_stats('-r', columnarfile, *options) == time_pay_stats('-r', textfile, *options)
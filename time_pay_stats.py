@@ -26,33 +26,24 @@ HIT and what the corresponding hourly rates are
 """
 
 from __future__ import print_function, division
-from csv import DictReader
 import argparse
-from dateutil.parser import parse
-import numpy as np
-from scipy.stats import gaussian_kde
-from scipy.stats import bayes_mvs
+# numpy, pandas, scipy, dateutil and matplotlib are slow to import, so they're
+# only imported once the arguments are parsed, and then only where needed
 
 __author__ = 'Andrew Watts <awatts2@ur.rochester.edu>'
 
-HOUR = 3600
+PERCENTILES = (10, 25, 75, 90)
 
-def filter_outliers(arr):
-    """
-    Given an array, return the array minus outliers, where outliers are those
-    values greater than two standard deviations from the mean
-    """
-    nparr = arr if isinstance(arr, np.ndarray) else np.array(arr)
-    twosigup = nparr.mean() + nparr.std() *2
-    twosigdown = nparr.mean() - nparr.std() *2
-
-    return [x for x in nparr if (x < twosigup) and (x > twosigdown)]
-
-def submit_time_histogram(arr):
+def submit_time_histogram(arr, counts=None):
     """
     Use Matplotlib to plot a normalized histogram of submit times
+
+    If counts is given, arr holds the bin values of a DurationHistogram and
+    counts how many submit times fell in each
     """
     from math import ceil, log
+    import numpy as np
+    from duration_stats import binned_kde
     try:
         import matplotlib.mlab as mlab
         from prettyplotlib import plt
@@ -60,26 +51,29 @@ def submit_time_histogram(arr):
         print('You must have Matplotlib and Prettyplotlib installed to plot a histogram.')
 
     # Use Sturges' formula for number of bins: k = ceiling(log2 n + 1)
-    k = ceil(log(len(arr), 2) + 1)
-    n, bins, patches = plt.hist(arr, k, normed=1, facecolor='green', alpha=0.75)
+    total = len(arr) if counts is None else counts.sum()
+    k = ceil(log(total, 2) + 1)
+    n, bins, patches = plt.hist(arr, k, weights=counts, normed=1, facecolor='green', alpha=0.75)
     # throw a PDF plot on top of it
     #y = mlab.normpdf(bins, np.mean(arr), np.std(arr))
     #l = plt.plot(bins, y, 'r--', linewidth=1)
 
-    # Get a Bayesian confidence interval for mean, variance, standard deviation
-    dmean, dvar, dsd = bayes_mvs(deltas)
-
     # drop a line in at the mean for fun
-    plt.axvline(dmean[0], color='blue', alpha=0.5)
-    plt.axvspan(dmean[1][0], dmean[1][1], color='blue', alpha=0.5)
-    plt.axvline(np.median(deltas), color='y', alpha=0.5)
-
-    # Caclulate a Kernel Density Estimate
-    density = gaussian_kde(deltas)
-    xs = np.arange(0., np.max(deltas), 0.1)
-    density.covariance_factor = lambda : .25
-    density._compute_covariance()
-    plt.plot(xs,density(xs), color='m')
+    if counts is None:
+        # Get a Bayesian confidence interval for mean, variance, standard deviation
+        from scipy.stats import bayes_mvs
+        dmean, dvar, dsd = bayes_mvs(arr)
+        plt.axvline(dmean[0], color='blue', alpha=0.5)
+        plt.axvspan(dmean[1][0], dmean[1][1], color='blue', alpha=0.5)
+        plt.axvline(np.median(arr), color='y', alpha=0.5)
+    else:
+        plt.axvline(np.average(arr, weights=counts), color='blue', alpha=0.5)
+        plt.axvline(arr[np.searchsorted(np.cumsum(counts), (total - 1) / 2, side='right')], color='y', alpha=0.5)
+
+    # Caclulate a Kernel Density Estimate on a fixed grid, which stays quick
+    # however long the slowest worker took
+    xs, density = binned_kde(arr, counts)
+    plt.plot(xs, density, color='m')
 
     #FIXME: come up with better legend names
     #plt.legend(('Normal Curve', 'Mean', 'Median', 'KDE'))
@@ -92,63 +86,147 @@ def submit_time_histogram(arr):
 
     plt.show()
 
-parser = argparse.ArgumentParser(description='Calculate the min, max, mean, and'
-                                              'median time workers took to do a'
-                                              'particular HIT and what the'
-                                              'corresponding hourly rates are')
-parser.add_argument('-r', '--resultsfiles', nargs='*', required=True, help='(required) Results file to use')
-parser.add_argument('-p', '--pay', type=float, required=True, help='Pay per HIT')
-parser.add_argument('-o', '--removeoutliers', required=False, action="store_true",
-                    default=False, help='Remove outlier values?')
-parser.add_argument('-j', '--removerejected', required=False, action="store_true",
-                    default=False, help='Remove rejected workers?')
-parser.add_argument('-t', '--plot', required=False, action="store_true",
-                    default=False, help='Plot a histogram of submit times')
-args = parser.parse_args()
-
-results = []
-for r in args.resultsfiles:
-    with open(r, 'r') as resfile:
-        results.extend(list(DictReader(resfile, delimiter='\t')))
-
-if args.removerejected:
-    print("Workers before filtering rejected: {}".format(len(results)))
-    results = [x for x in results if x['assignmentstatus'] != 'Rejected']
-    print("Workers after filtering rejected: {}".format(len(results)))
-
-deltas = []
-for row in results:
-    delta = parse(row['assignmentsubmittime']) - parse(row['assignmentaccepttime'])
-    deltas.append(delta.total_seconds())
-
-if args.removeoutliers:
-    print("Workers before filtering outliers: {}".format(len(deltas)))
-    deltas = filter_outliers(deltas)
-    print("Workers after filtering outliers: {}".format(len(deltas)))
-
-minsubmit = np.min(deltas)
-print("\nFastest time: {:.2f} seconds ({:.2f} minutes)".format(minsubmit, minsubmit / 60))
-maxsubmit = np.max(deltas)
-print("Slowest time: {:.2f} seconds ({:.2f} minutes)".format(maxsubmit, maxsubmit / 60))
-medsubmit = np.median(deltas)
-print("Median time: {:.2f} seconds ({:.2f} minutes)".format(medsubmit, medsubmit / 60))
-meansubmit = np.mean(deltas)
-print("Mean time: {:.2f} seconds ({:.2f} minutes)".format(meansubmit, meansubmit / 60))
-stdsubmit = np.std(deltas)
-print("Standard deviation: {:.2f} seconds ({:.2f} minutes)".format(stdsubmit, stdsubmit / 60))
-twostd = stdsubmit * 2
-lowsub = meansubmit - twostd
-highsub = meansubmit + twostd
-print("98% of workers should be between {:.2f} seconds ({:.2f} minutes) and {:.2f} seconds ({:.2f} minutes)".format(lowsub, lowsub / 60, highsub, highsub / 60))
-
-minpay = (HOUR / maxsubmit) * args.pay
-print("\nMinimum hourly pay: ${:.2f}".format(minpay))
-meanpay = (HOUR / meansubmit) * args.pay
-print("Mean hourly pay: ${:.2f}".format(meanpay))
-medpay = (HOUR / medsubmit) * args.pay
-print("Median hourly pay: ${:.2f}".format(medpay))
-maxpay = (HOUR / minsubmit) * args.pay
-print("Maximum hourly pay: ${:.2f}".format(maxpay))
-
-if args.plot:
-    submit_time_histogram(deltas)
+def main():
+    parser = argparse.ArgumentParser(description='Calculate the min, max, mean, and'
+                                                  'median time workers took to do a'
+                                                  'particular HIT and what the'
+                                                  'corresponding hourly rates are')
+    parser.add_argument('-r', '--resultsfiles', nargs='*', required=True, help='(required) Results file to use')
+    parser.add_argument('-p', '--pay', type=float,
+                        help="Pay per HIT (default: each HIT's reward column)")
+    parser.add_argument('-o', '--removeoutliers', required=False, action="store_true",
+                        default=False, help='Remove outlier values?')
+    parser.add_argument('-j', '--removerejected', required=False, action="store_true",
+                        default=False, help='Remove rejected workers?')
+    parser.add_argument('-t', '--plot', required=False, action="store_true",
+                        default=False, help='Plot a histogram of submit times')
+    parser.add_argument('-s', '--streaming', required=False, type=int, metavar='ROWS',
+                        help='Read the results files this many rows at a time into a fixed-size '
+                             'histogram instead of all at once. Percentiles are then accurate '
+                             'to within 0.5%%.')
+    parser.add_argument('-g', '--groupby', nargs='+', choices=('hittypeid', 'workerid', 'batch'), default=[],
+                        help='Also report times and pay for each HIT type, worker and/or batch (results '
+                             'file). Not available with --streaming.')
+    parser.add_argument('-n', '--processes', type=int,
+                        help='Number of results files to read at once (default: one per CPU)')
+    parser.add_argument('--cache', action='store_true',
+                        help='Keep the parsed columns of each results file under ~/.mturkutils/results, '
+                             'so later runs on the same files skip parsing them')
+    parser.add_argument('-w', '--minwage', type=float,
+                        help='Report how many assignments paid less than this per hour')
+    args = parser.parse_args()
+    if args.streaming and args.groupby:
+        parser.error('--groupby needs every row in memory, so it cannot be used with --streaming')
+
+    columns = ([] if args.pay else ['reward']) + args.groupby
+
+    import numpy as np
+    from duration_stats import (HOUR, RESULTS_COLUMNS, TIME_COLUMNS, DurationHistogram,
+                                assignment_times, outlier_mask, pay_rates, stream_results)
+    from results_loader import DEFAULT_CACHE_DIR, load_results
+
+    if args.streaming:
+        # with outliers removed, the first pass only works out the mean and
+        # standard deviation to filter on in the second
+        passes = 2 if args.removeoutliers else 1
+        for p in range(passes):
+            histogram = DurationHistogram()
+            # seconds per dollar, so pay works the same whether rewards vary or not
+            perdollar = DurationHistogram(min_seconds=0.001, max_seconds=10 ** 8)
+            rows = 0
+            totalpay = 0.0
+            underpaid = 0
+            for chunk_rows, chunk in stream_results(args.resultsfiles, args.removerejected, columns, args.streaming):
+                rows += chunk_rows
+                if p == 1:
+                    chunk = chunk[(chunk['seconds'] < twosigup) & (chunk['seconds'] > twosigdown)]
+                chunk_pay = args.pay or chunk['reward']
+                histogram.add(chunk['seconds'].values)
+                perdollar.add((chunk['seconds'] / chunk_pay).values)
+                totalpay += args.pay * len(chunk) if args.pay else chunk['reward'].sum()
+                if args.minwage:
+                    underpaid += (chunk['seconds'] / chunk_pay > HOUR / args.minwage).sum()
+            if p == 0:
+                unfiltered = histogram.n
+                twosigup = histogram.mean() + histogram.std() * 2
+                twosigdown = histogram.mean() - histogram.std() * 2
+        if args.removerejected:
+            print("Workers before filtering rejected: {}".format(rows))
+            print("Workers after filtering rejected: {}".format(unfiltered))
+        if args.removeoutliers:
+            print("Workers before filtering outliers: {}".format(unfiltered))
+            print("Workers after filtering outliers: {}".format(histogram.n))
+        minsubmit, maxsubmit = histogram.min, histogram.max
+        medsubmit = histogram.median()
+        meansubmit = histogram.mean()
+        stdsubmit = histogram.std()
+        percentiles = [histogram.quantile(q / 100) for q in PERCENTILES]
+        minpay = HOUR / perdollar.max
+        meanpay = HOUR * totalpay / histogram.total
+        medpay = HOUR / perdollar.median()
+        maxpay = HOUR / perdollar.min
+        underpaid /= histogram.n
+    else:
+        results = load_results(args.resultsfiles, RESULTS_COLUMNS + [c for c in columns if c != 'batch'],
+                               categorical=['assignmentstatus', 'hittypeid', 'workerid', 'reward'],
+                               times=TIME_COLUMNS, source='batch', processes=args.processes,
+                               cachedir=DEFAULT_CACHE_DIR if args.cache else None)
+
+        if args.removerejected:
+            print("Workers before filtering rejected: {}".format(len(results)))
+            results = results[results['assignmentstatus'] != 'Rejected']
+            print("Workers after filtering rejected: {}".format(len(results)))
+        results = assignment_times(results, columns)
+
+        if args.removeoutliers:
+            print("Workers before filtering outliers: {}".format(len(results)))
+            results = results[outlier_mask(results['seconds'].values)]
+            print("Workers after filtering outliers: {}".format(len(results)))
+
+        deltas = results['seconds'].values
+        minsubmit = np.min(deltas)
+        maxsubmit = np.max(deltas)
+        medsubmit = np.median(deltas)
+        meansubmit = np.mean(deltas)
+        stdsubmit = np.std(deltas)
+        percentiles = np.percentile(deltas, PERCENTILES)
+
+        if args.pay:
+            results['reward'] = args.pay
+        # everything at once is just a single group
+        overall = pay_rates(results.assign(all=True), 'all', args.minwage).iloc[0]
+        minpay, meanpay, medpay, maxpay = overall[['minpay', 'meanpay', 'medianpay', 'maxpay']]
+        underpaid = overall.get('underpaid')
+
+    print("\nFastest time: {:.2f} seconds ({:.2f} minutes)".format(minsubmit, minsubmit / 60))
+    print("Slowest time: {:.2f} seconds ({:.2f} minutes)".format(maxsubmit, maxsubmit / 60))
+    print("Median time: {:.2f} seconds ({:.2f} minutes)".format(medsubmit, medsubmit / 60))
+    for q, value in zip(PERCENTILES, percentiles):
+        print("{}th percentile: {:.2f} seconds ({:.2f} minutes)".format(q, value, value / 60))
+    print("Mean time: {:.2f} seconds ({:.2f} minutes)".format(meansubmit, meansubmit / 60))
+    print("Standard deviation: {:.2f} seconds ({:.2f} minutes)".format(stdsubmit, stdsubmit / 60))
+    twostd = stdsubmit * 2
+    lowsub = meansubmit - twostd
+    highsub = meansubmit + twostd
+    print("98% of workers should be between {:.2f} seconds ({:.2f} minutes) and {:.2f} seconds ({:.2f} minutes)".format(lowsub, lowsub / 60, highsub, highsub / 60))
+
+    print("\nMinimum hourly pay: ${:.2f}".format(minpay))
+    print("Mean hourly pay: ${:.2f}".format(meanpay))
+    print("Median hourly pay: ${:.2f}".format(medpay))
+    print("Maximum hourly pay: ${:.2f}".format(maxpay))
+    if args.minwage:
+        print("Paid less than ${:.2f} an hour: {:.1%}".format(args.minwage, underpaid))
+
+    for by in args.groupby:
+        print("\nBy {}:".format(by))
+        print(pay_rates(results, by, args.minwage).to_string(float_format='{:.2f}'.format))
+
+    if args.plot and args.streaming:
+        nonempty = histogram.counts > 0
+        submit_time_histogram(histogram.bin_values()[nonempty], histogram.counts[nonempty])
+    elif args.plot:
+        submit_time_histogram(deltas)
+
+
+if __name__ == '__main__':
+    main()